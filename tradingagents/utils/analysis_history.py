@@ -4,14 +4,43 @@
 负责保存、查询和管理股票分析历史记录
 """
 
+import atexit
 import json
 import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import BinaryIO, Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, asdict
 import uuid
+from collections import Counter
 
-@dataclass
+try:
+    from pymongo.errors import BulkWriteError
+    PYMONGO_AVAILABLE = True
+except ImportError:
+    PYMONGO_AVAILABLE = False
+
+# 列表视图不需要的大字段，默认查询时不返回
+HEAVY_FIELDS = ("results", "token_usage")
+
+# MongoDB TTL索引的保留天数（0表示不自动过期），由服务端后台线程清理过期记录
+DEFAULT_RETENTION_DAYS = int(os.getenv("ANALYSIS_HISTORY_RETENTION_DAYS", "0"))
+# TTL索引要求BSON日期类型，created_at以ISO字符串存储，因此额外写入该字段
+TTL_FIELD = "created_at_dt"
+
+# 后台写入线程的队列容量和单批最大记录数
+WRITE_QUEUE_SIZE = 10_000
+WRITE_BATCH_SIZE = 100
+# 按ID批量删除时每批$in的最大ID数，避免超出BSON大小限制和长时间持锁
+DELETE_BATCH_SIZE = 1000
+# MongoDB重复键错误码：唯一索引上的record_id已存在，说明该记录已写入
+DUPLICATE_KEY_ERROR = 11000
+
+@dataclass(slots=True)
 class AnalysisRecord:
     """分析记录数据类"""
     record_id: str
@@ -57,7 +86,20 @@ class AnalysisHistoryManager:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.collection_name = "analysis_history"
+        # 历史文件目录只计算一次，避免每次读写都重新解析路径和mkdir
+        self._history_dir = Path(__file__).resolve().parents[2] / "data" / "analysis_history"
+        self._history_dir.mkdir(parents=True, exist_ok=True)
+        # 按日期缓存的追加写文件句柄，跨日时轮换
+        self._open_file: Optional[Tuple[str, BinaryIO]] = None
+        self._file_lock = threading.Lock()
+        atexit.register(self._close_history_file)
         self._initialize_database()
+        
+        # 保存操作只入队，由后台线程批量写入存储
+        self._write_queue: "queue.Queue[AnalysisRecord]" = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._writer = threading.Thread(target=self._writer_loop, name="analysis-history-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
     
     def _initialize_database(self):
         """初始化数据库连接"""
@@ -107,10 +149,34 @@ class AnalysisHistoryManager:
                 self.collection.create_index([("created_at", -1)])
                 self.collection.create_index([("success", 1)])
                 self.collection.create_index([("llm_provider", 1)])
+                # 按ID查询/批量删除使用；record_id为uuid4，唯一索引同时防止重复写入
+                self.collection.create_index([("record_id", 1)], unique=True)
+                if DEFAULT_RETENTION_DAYS > 0:
+                    self._ensure_ttl_index(DEFAULT_RETENTION_DAYS)
                 self.logger.info("✅ 历史记录索引创建完成")
             except Exception as e:
                 self.logger.warning(f"⚠️ 索引创建失败: {e}")
     
+    def _ensure_ttl_index(self, days: int):
+        """创建或更新TTL索引，过期记录由MongoDB后台清理"""
+        expire_seconds = int(timedelta(days=days).total_seconds())
+        index_name = f"{TTL_FIELD}_1"
+        
+        existing = self.collection.index_information().get(index_name)
+        if existing is None:
+            self.collection.create_index([(TTL_FIELD, 1)], expireAfterSeconds=expire_seconds)
+        elif existing.get("expireAfterSeconds") != expire_seconds:
+            self.mongodb_db.command(
+                "collMod", self.collection_name,
+                index={"keyPattern": {TTL_FIELD: 1}, "expireAfterSeconds": expire_seconds}
+            )
+    
+    def _to_mongo_document(self, record: AnalysisRecord) -> Dict[str, Any]:
+        """转换为MongoDB文档，附加TTL使用的日期字段"""
+        document = record.to_dict()
+        document[TTL_FIELD] = record.created_at
+        return document
+    
     def save_analysis_record(self, 
                            session_id: str,
                            stock_symbol: str,
@@ -156,60 +222,120 @@ class AnalysisHistoryManager:
                 total_cost=total_cost
             )
             
-            if hasattr(self, 'collection') and self.collection is not None:
-                # 保存到MongoDB
-                self.collection.insert_one(record.to_dict())
-                self.logger.info(f"✅ 分析记录已保存到MongoDB: {record_id}")
-            else:
-                # 保存到文件
-                self._save_to_file(record)
-                self.logger.info(f"✅ 分析记录已保存到文件: {record_id}")
-            
-            # 缓存到Redis（如果可用）
-            if hasattr(self, 'redis_client') and self.redis_client is not None:
-                self._cache_to_redis(record)
+            # 入队后立即返回，队列满时退化为同步写入
+            try:
+                self._write_queue.put_nowait(record)
+            except queue.Full:
+                self.logger.warning("⚠️ 历史记录写入队列已满，改为同步写入")
+                self._write_records([record])
                 
             return record_id
             
         except Exception as e:
             self.logger.error(f"❌ 保存分析记录失败: {e}")
-            # 降级到文件存储
+            return record_id
+    
+    def _writer_loop(self):
+        """后台写入线程：每次取出一批记录统一写入"""
+        while True:
+            batch = [self._write_queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
             try:
-                self._save_to_file(record)
-                return record_id
-            except:
-                return record_id
+                self._write_records(batch)
+            except Exception as e:
+                self.logger.error(f"❌ 批量保存分析记录失败: {e}")
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
     
-    def _save_to_file(self, record: AnalysisRecord):
-        """保存记录到文件"""
-        import os
-        from pathlib import Path
-        
-        # 获取项目根目录
-        project_root = Path(__file__).parent.parent.parent
-        
-        # 确保目录存在
-        history_dir = project_root / "data" / "analysis_history"
-        history_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 按日期组织文件
-        date_str = record.created_at.strftime("%Y-%m-%d")
-        file_path = history_dir / f"analysis_{date_str}.jsonl"
+    def _write_records(self, records: List[AnalysisRecord]):
+        """批量写入记录到MongoDB或文件，并缓存到Redis"""
+        try:
+            if self.collection is not None:
+                # 保存到MongoDB
+                self.collection.insert_many([self._to_mongo_document(r) for r in records], ordered=False)
+                self.logger.info(f"✅ {len(records)} 条分析记录已保存到MongoDB")
+            else:
+                # 保存到文件
+                self._save_records_to_file(records)
+                self.logger.info(f"✅ {len(records)} 条分析记录已保存到文件")
+        except Exception as e:
+            self.logger.error(f"❌ 保存分析记录失败: {e}")
+            # 降级到文件存储；insert_many(ordered=False)部分失败时其余记录已写入MongoDB，
+            # 只降级未写入的记录，重复键说明记录已存在，同样不再写入文件，避免重复保存
+            failed = records
+            if PYMONGO_AVAILABLE and isinstance(e, BulkWriteError):
+                failed_indexes = {
+                    error["index"] for error in e.details.get("writeErrors", [])
+                    if error.get("code") != DUPLICATE_KEY_ERROR
+                }
+                failed = [record for index, record in enumerate(records) if index in failed_indexes]
+            if failed:
+                self._save_records_to_file(failed)
         
-        # 追加记录到文件
-        with open(file_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+        # 缓存到Redis（如果可用）
+        if self.redis_client is not None:
+            self._cache_records_to_redis(records)
+    
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待队列中的记录全部写入，超时返回False"""
+        deadline = time.monotonic() + timeout
+        with self._write_queue.all_tasks_done:
+            while self._write_queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._write_queue.all_tasks_done.wait(remaining)
+        return True
+    
+    def _save_records_to_file(self, records: List[AnalysisRecord]):
+        """批量保存记录到文件"""
+        # 复用当天的文件句柄追加记录，避免每条记录都open/close
+        with self._file_lock:
+            for record in records:
+                # 按日期组织文件
+                date_str = record.created_at.strftime("%Y-%m-%d")
+                if self._open_file is None or self._open_file[0] != date_str:
+                    self._close_history_file_locked()
+                    file_path = self._history_dir / f"analysis_{date_str}.jsonl"
+                    self._open_file = (date_str, open(file_path, "ab", buffering=1024 * 1024))
+                self._open_file[1].write((json.dumps(record.to_dict(), ensure_ascii=False) + "\n").encode("utf-8"))
+            # 每批写入后flush，保证读取方能立即看到新记录
+            if self._open_file is not None:
+                self._open_file[1].flush()
+    
+    def _close_history_file_locked(self):
+        """关闭缓存的文件句柄（调用方需持有 _file_lock）"""
+        if self._open_file is not None:
+            try:
+                self._open_file[1].close()
+            except Exception as e:
+                self.logger.warning(f"⚠️ 关闭历史文件失败: {e}")
+            self._open_file = None
+    
+    def _close_history_file(self):
+        """flush并关闭缓存的文件句柄"""
+        with self._file_lock:
+            self._close_history_file_locked()
     
-    def _cache_to_redis(self, record: AnalysisRecord):
-        """缓存记录到Redis"""
+    def _cache_records_to_redis(self, records: List[AnalysisRecord]):
+        """通过pipeline批量缓存记录到Redis"""
         try:
             # 缓存最近的记录，设置过期时间为7天
-            key = f"analysis_history:{record.record_id}"
-            self.redis_client.setex(
-                key, 
-                int(timedelta(days=7).total_seconds()),
-                json.dumps(record.to_dict(), ensure_ascii=False)
-            )
+            expire_seconds = int(timedelta(days=7).total_seconds())
+            pipe = self.redis_client.pipeline()
+            for record in records:
+                pipe.setex(
+                    f"analysis_history:{record.record_id}",
+                    expire_seconds,
+                    json.dumps(record.to_dict(), ensure_ascii=False)
+                )
+            pipe.execute()
         except Exception as e:
             self.logger.warning(f"⚠️ Redis缓存失败: {e}")
     
@@ -219,19 +345,53 @@ class AnalysisHistoryManager:
                            offset: int = 0,
                            success_only: bool = False,
                            date_from: Optional[datetime] = None,
-                           date_to: Optional[datetime] = None) -> List[Dict[str, Any]]:
-        """获取分析历史记录"""
-        
+                           date_to: Optional[datetime] = None,
+                           full: bool = False,
+                           llm_provider: Optional[str] = None,
+                           research_depth: Optional[int] = None,
+                           failure_only: bool = False,
+                           sort_by: str = "created_at",
+                           ascending: bool = False) -> List[Dict[str, Any]]:
+        """获取分析历史记录
+        
+        默认不返回 results/token_usage 等大字段，需要完整记录时传入 full=True；
+        llm_provider/research_depth/failure_only 过滤条件和 sort_by 排序在查询时直接应用
+        """
+        # 先等待后台队列写完，保证能读到/删到刚保存的记录
+        self.flush()
+        
+        filters = (llm_provider, research_depth, failure_only, sort_by, ascending)
         try:
             if hasattr(self, 'collection') and self.collection is not None:
-                return self._get_from_mongodb(stock_symbol, limit, offset, success_only, date_from, date_to)
+                return self._get_from_mongodb(stock_symbol, limit, offset, success_only, date_from, date_to, full, *filters)
             else:
-                return self._get_from_files(stock_symbol, limit, offset, success_only, date_from, date_to)
+                return self._get_from_files(stock_symbol, limit, offset, success_only, date_from, date_to, full, *filters)
         except Exception as e:
             self.logger.error(f"❌ 获取历史记录失败: {e}")
             return []
     
-    def _get_from_mongodb(self, stock_symbol, limit, offset, success_only, date_from, date_to):
+    def get_analysis_record(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """根据记录ID获取单条完整记录"""
+        self.flush()
+        try:
+            if hasattr(self, 'collection') and self.collection is not None:
+                return self.collection.find_one({"record_id": record_id}, {"_id": 0, TTL_FIELD: 0})
+            
+            for file_path in sorted(self._history_dir.glob("analysis_*.jsonl"), reverse=True):
+                with open(file_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if record_id in line:
+                            record = json.loads(line.strip())
+                            if record.get("record_id") == record_id:
+                                return record
+            return None
+        except Exception as e:
+            self.logger.error(f"❌ 获取记录失败: {e}")
+            return None
+    
+    def _get_from_mongodb(self, stock_symbol, limit, offset, success_only, date_from, date_to, full=False,
+                          llm_provider=None, research_depth=None, failure_only=False,
+                          sort_by="created_at", ascending=False):
         """从MongoDB获取记录"""
         if self.collection is None:
             return []
@@ -244,46 +404,58 @@ class AnalysisHistoryManager:
         
         if success_only:
             query["success"] = True
+        elif failure_only:
+            query["success"] = {"$ne": True}
+        
+        if llm_provider:
+            query["llm_provider"] = llm_provider
+        
+        if research_depth is not None:
+            # 旧版记录的研究深度以字符串存储，两种类型都要匹配
+            query["research_depth"] = {"$in": [research_depth, str(research_depth)]}
         
         if date_from or date_to:
+            # created_at以ISO字符串存储，按字符串比较才能匹配
             date_query = {}
             if date_from:
-                date_query["$gte"] = date_from
+                date_query["$gte"] = date_from.isoformat()
             if date_to:
-                date_query["$lte"] = date_to
+                date_query["$lte"] = date_to.isoformat()
             if date_query:
                 query["created_at"] = date_query
         
-        # 执行查询
-        cursor = self.collection.find(query).sort("created_at", -1).skip(offset).limit(limit)
-        records = list(cursor)
+        # 只投影需要的字段，_id和内部使用的TTL字段由服务端直接排除
+        projection = {"_id": 0, TTL_FIELD: 0}
+        if not full:
+            projection.update({field: 0 for field in HEAVY_FIELDS})
         
-        # 移除MongoDB的_id字段
-        for record in records:
-            if '_id' in record:
-                del record['_id']
+        # 执行查询
+        cursor = self.collection.find(query, projection).sort(sort_by, 1 if ascending else -1).skip(offset).limit(limit)
+        if stock_symbol and sort_by == "created_at":
+            # 按股票过滤时走 (stock_symbol, created_at) 复合索引，排序无需内存完成
+            cursor = cursor.hint([("stock_symbol", 1), ("created_at", -1)])
         
-        return records
+        return list(cursor)
     
-    def _get_from_files(self, stock_symbol, limit, offset, success_only, date_from, date_to):
+    def _get_from_files(self, stock_symbol, limit, offset, success_only, date_from, date_to, full=False,
+                        llm_provider=None, research_depth=None, failure_only=False,
+                        sort_by="created_at", ascending=False):
         """从文件获取记录"""
-        import os
-        from pathlib import Path
-        
-        # 获取项目根目录
-        project_root = Path(__file__).parent.parent.parent
-        history_dir = project_root / "data" / "analysis_history"
+        history_dir = self._history_dir
         
         if not history_dir.exists():
             return []
         
         records = []
+        # 文件按日期倒序读取、每个文件内的行（按时间追加写入）倒序遍历，得到的记录即按时间倒序，
+        # 默认排序时取够条数即可停止；其他排序方式需要读取全部匹配记录后再排序
+        stop_at = limit + offset if sort_by == "created_at" and not ascending else None
         
         # 读取所有历史文件，按日期倒序
         for file_path in sorted(history_dir.glob("analysis_*.jsonl"), reverse=True):
             try:
                 with open(file_path, "r", encoding="utf-8") as f:
-                    for line in f:
+                    for line in reversed(f.readlines()):
                         if line.strip():
                             record = json.loads(line.strip())
                             
@@ -294,6 +466,15 @@ class AnalysisHistoryManager:
                             if success_only and not record.get("success", False):
                                 continue
                             
+                            if failure_only and record.get("success", False):
+                                continue
+                            
+                            if llm_provider and record.get("llm_provider") != llm_provider:
+                                continue
+                            
+                            if research_depth is not None and str(record.get("research_depth")) != str(research_depth):
+                                continue
+                            
                             # 日期过滤
                             created_at = datetime.fromisoformat(record["created_at"])
                             if date_from and created_at < date_from:
@@ -301,25 +482,34 @@ class AnalysisHistoryManager:
                             if date_to and created_at > date_to:
                                 continue
                             
+                            if not full:
+                                for field in HEAVY_FIELDS:
+                                    record.pop(field, None)
+                            
                             records.append(record)
                             
                             # 检查是否已达到限制
-                            if len(records) >= limit + offset:
+                            if stop_at and len(records) >= stop_at:
                                 break
                 
                 # 如果已达到限制，停止读取更多文件
-                if len(records) >= limit + offset:
+                if stop_at and len(records) >= stop_at:
                     break
                     
             except Exception as e:
                 self.logger.warning(f"⚠️ 读取历史文件失败: {file_path}: {e}")
                 continue
         
+        if stop_at is None:
+            default = "" if sort_by == "created_at" else 0
+            records.sort(key=lambda record: record.get(sort_by) or default, reverse=not ascending)
+        
         # 应用偏移和限制
         return records[offset:offset + limit]
     
     def get_analysis_statistics(self) -> Dict[str, Any]:
         """获取分析统计信息"""
+        self.flush()
         try:
             if hasattr(self, 'collection') and self.collection is not None:
                 return self._get_stats_from_mongodb()
@@ -361,12 +551,7 @@ class AnalysisHistoryManager:
     
     def _get_stats_from_files(self):
         """从文件获取统计信息"""
-        import os
-        from pathlib import Path
-        
-        # 获取项目根目录
-        project_root = Path(__file__).parent.parent.parent
-        history_dir = project_root / "data" / "analysis_history"
+        history_dir = self._history_dir
         
         if not history_dir.exists():
             return {}
@@ -404,21 +589,174 @@ class AnalysisHistoryManager:
             "unique_stocks_count": len(unique_stocks)
         }
     
-    def delete_old_records(self, days: int = 30):
-        """删除旧的分析记录"""
-        cutoff_date = datetime.now() - timedelta(days=days)
+    def get_chart_statistics(self, days: int = 30) -> Dict[str, Any]:
+        """获取图表所需的聚合数据，直接在存储端完成分组统计
+        
+        返回 daily: [(日期, 分析次数, 成功次数), ...]（最近days天，按日期升序），
+        providers/markets: {名称: 次数}
+        """
+        self.flush()
+        since = (datetime.now() - timedelta(days=days)).date().isoformat()
+        try:
+            if hasattr(self, 'collection') and self.collection is not None:
+                return self._get_chart_stats_from_mongodb(since)
+            else:
+                return self._get_chart_stats_from_files(since)
+        except Exception as e:
+            self.logger.error(f"❌ 获取图表统计失败: {e}")
+            return {}
+    
+    def _get_chart_stats_from_mongodb(self, since: str):
+        """从MongoDB获取图表统计，三个分组在一次聚合中完成"""
+        if self.collection is None:
+            return {}
+        
+        pipeline = [
+            {
+                "$facet": {
+                    # created_at为ISO字符串，前10位即日期
+                    "daily": [
+                        {"$match": {"created_at": {"$gte": since}}},
+                        {"$group": {
+                            "_id": {"$substrBytes": ["$created_at", 0, 10]},
+                            "count": {"$sum": 1},
+                            "success": {"$sum": {"$cond": [{"$eq": ["$success", True]}, 1, 0]}}
+                        }},
+                        {"$sort": {"_id": 1}}
+                    ],
+                    "providers": [{"$group": {"_id": "$llm_provider", "count": {"$sum": 1}}}],
+                    "markets": [{"$group": {"_id": "$market_type", "count": {"$sum": 1}}}]
+                }
+            }
+        ]
+        
+        result = list(self.collection.aggregate(pipeline))
+        if not result:
+            return {}
+        
+        facets = result[0]
+        return {
+            "daily": [(d["_id"], d["count"], d["success"]) for d in facets["daily"]],
+            "providers": {d["_id"]: d["count"] for d in facets["providers"]},
+            "markets": {d["_id"]: d["count"] for d in facets["markets"]}
+        }
+    
+    def _get_chart_stats_from_files(self, since: str):
+        """从文件获取图表统计，一次遍历完成全部计数"""
+        history_dir = self._history_dir
+        
+        if not history_dir.exists():
+            return {}
+        
+        daily_counts = Counter()
+        daily_success = Counter()
+        providers = Counter()
+        markets = Counter()
+        
+        for file_path in history_dir.glob("analysis_*.jsonl"):
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            record = json.loads(line.strip())
+                            providers[record.get("llm_provider")] += 1
+                            markets[record.get("market_type")] += 1
+                            
+                            date = record.get("created_at", "")[:10]
+                            if date >= since:
+                                daily_counts[date] += 1
+                                if record.get("success", False):
+                                    daily_success[date] += 1
+                            
+            except Exception as e:
+                self.logger.warning(f"⚠️ 读取统计文件失败: {file_path}: {e}")
+                continue
+        
+        return {
+            "daily": [(date, daily_counts[date], daily_success[date]) for date in sorted(daily_counts)],
+            "providers": dict(providers),
+            "markets": dict(markets)
+        }
+    
+    def delete_old_records(self, days: int = 30) -> int:
+        """一次性删除早于指定天数的记录，返回删除条数
+        
+        只删除当前已存在的旧记录，不设置保留策略；自动过期由 ANALYSIS_HISTORY_RETENTION_DAYS 配置的TTL索引负责
+        """
+        self.flush()
+        # created_at以ISO字符串存储，按字符串比较即按时间比较
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat()
         
         try:
             if self.collection is not None:
-                result = self.collection.delete_many({"created_at": {"$lt": cutoff_date}})
-                self.logger.info(f"✅ 删除了 {result.deleted_count} 条旧记录")
-                return result.deleted_count
+                deleted_count = self.collection.delete_many({"created_at": {"$lt": cutoff}}).deleted_count
+            else:
+                deleted_count = self._delete_matching_from_files(lambda record: record.get("created_at", "") < cutoff)
+            
+            self.logger.info(f"✅ 删除了 {deleted_count} 条 {days} 天前的旧记录")
+            return deleted_count
         except Exception as e:
             self.logger.error(f"❌ 删除旧记录失败: {e}")
             return 0
 
+    def delete_by_stock_symbol(self, stock_symbol: str) -> int:
+        """删除指定股票代码的全部记录，返回删除条数
+        
+        MongoDB中直接按条件delete_many，不再先查询记录ID；Redis中的缓存与旧记录清理一致，交由过期时间回收
+        """
+        self.flush()
+        stock_symbol = stock_symbol.upper()
+        
+        try:
+            if self.collection is not None:
+                result = self.collection.delete_many({"stock_symbol": stock_symbol})
+                deleted_count = result.deleted_count
+            else:
+                deleted_count = self._delete_matching_from_files(
+                    lambda record: record.get("stock_symbol", "").upper() == stock_symbol
+                )
+            
+            self.logger.info(f"✅ 删除股票 {stock_symbol} 的记录 {deleted_count} 条")
+            return deleted_count
+        except Exception as e:
+            self.logger.error(f"❌ 按股票代码删除记录失败: {e}")
+            return 0
+
+    def _count_file_records_locked(self) -> int:
+        """统计历史文件中的记录数（调用方需持有 _file_lock）"""
+        total = 0
+        if self._history_dir.exists():
+            for file_path in self._history_dir.glob("analysis_*.jsonl"):
+                with open(file_path, "r", encoding="utf-8") as f:
+                    total += sum(1 for line in f if line.strip())
+        return total
+    
+    def clear_all(self) -> int:
+        """清空全部记录，返回删除条数
+        
+        MongoDB中直接delete_many({})，文件存储直接删除历史文件，不需要先获取记录ID
+        """
+        self.flush()
+        try:
+            if self.collection is not None:
+                deleted_count = self.collection.delete_many({}).deleted_count
+            else:
+                # 统计和删除期间持有文件锁，后台写入线程不会在此期间追加记录
+                with self._file_lock:
+                    deleted_count = self._count_file_records_locked()
+                    self._close_history_file_locked()
+                    for file_path in self._history_dir.glob("analysis_*.jsonl"):
+                        file_path.unlink()
+            
+            self.logger.info(f"✅ 已清空全部记录: {deleted_count} 条")
+            return deleted_count
+        except Exception as e:
+            self.logger.error(f"❌ 清空记录失败: {e}")
+            return 0
+
     def delete_record_by_id(self, record_id: str) -> bool:
         """根据记录ID删除单条记录"""
+        self.flush()
         try:
             if self.collection is not None:
                 # MongoDB删除
@@ -449,32 +787,36 @@ class AnalysisHistoryManager:
     
     def delete_records_by_ids(self, record_ids: List[str]) -> int:
         """根据记录ID列表批量删除记录"""
+        self.flush()
+        
         deleted_count = 0
         
         self.logger.info(f"🗑️ 开始删除 {len(record_ids)} 条记录: {record_ids[:3]}{'...' if len(record_ids) > 3 else ''}")
         
         try:
             if self.collection is not None:
-                # MongoDB批量删除
+                # MongoDB分批删除，每批一次delete_many
                 self.logger.info(f"📊 使用MongoDB删除记录")
-                result = self.collection.delete_many({"record_id": {"$in": record_ids}})
-                deleted_count = result.deleted_count
+                for start in range(0, len(record_ids), DELETE_BATCH_SIZE):
+                    chunk = record_ids[start:start + DELETE_BATCH_SIZE]
+                    result = self.collection.delete_many({"record_id": {"$in": chunk}})
+                    deleted_count += result.deleted_count
                 self.logger.info(f"✅ MongoDB删除结果: {deleted_count}/{len(record_ids)} 条记录")
             else:
-                # 文件批量删除
+                # 文件批量删除，所有文件只遍历重写一次
                 self.logger.info(f"📁 使用文件存储删除记录")
-                for record_id in record_ids:
-                    if self._delete_from_files(record_id):
-                        deleted_count += 1
+                ids_to_delete = set(record_ids)
+                deleted_count = self._delete_matching_from_files(lambda record: record.get("record_id") in ids_to_delete)
                 self.logger.info(f"✅ 文件删除结果: {deleted_count}/{len(record_ids)} 条记录")
             
             # 从Redis缓存中删除
             if hasattr(self, 'redis_client') and self.redis_client is not None:
                 try:
-                    keys = [f"analysis_history:{record_id}" for record_id in record_ids]
-                    if keys:
-                        cache_deleted = self.redis_client.delete(*keys)
-                        self.logger.info(f"🗂️ Redis缓存删除: {cache_deleted} 个键")
+                    cache_deleted = 0
+                    for start in range(0, len(record_ids), DELETE_BATCH_SIZE):
+                        keys = [f"analysis_history:{record_id}" for record_id in record_ids[start:start + DELETE_BATCH_SIZE]]
+                        cache_deleted += self.redis_client.delete(*keys)
+                    self.logger.info(f"🗂️ Redis缓存删除: {cache_deleted} 个键")
                 except Exception as e:
                     self.logger.warning(f"⚠️ Redis批量删除失败: {e}")
             
@@ -487,55 +829,53 @@ class AnalysisHistoryManager:
     
     def _delete_from_files(self, record_id: str) -> bool:
         """从文件中删除记录（通过重写文件）"""
-        import os
-        from pathlib import Path
-        import tempfile
-        
-        project_root = Path(__file__).parent.parent.parent
-        history_dir = project_root / "data" / "analysis_history"
+        return self._delete_matching_from_files(lambda record: record.get("record_id") == record_id) > 0
+
+    def _delete_matching_from_files(self, match) -> int:
+        """从文件中删除match(record)为真的全部记录（单次遍历重写文件），返回删除条数"""
+        history_dir = self._history_dir
         
         if not history_dir.exists():
-            return False
+            return 0
         
-        deleted = False
+        deleted_count = 0
         
-        # 遍历所有历史文件
-        for file_path in history_dir.glob("analysis_*.jsonl"):
-            try:
-                lines_to_keep = []
-                found_record = False
+        # 重写/删除期间持有文件锁：先关闭缓存的追加句柄，后台写入线程也不会在读取和重写之间追加记录
+        with self._file_lock:
+            self._close_history_file_locked()
                 
-                # 读取文件，过滤掉要删除的记录
-                with open(file_path, "r", encoding="utf-8") as f:
-                    for line in f:
-                        if line.strip():
-                            try:
-                                record = json.loads(line.strip())
-                                if record.get("record_id") == record_id:
-                                    found_record = True
-                                    deleted = True
+            for file_path in history_dir.glob("analysis_*.jsonl"):
+                try:
+                    lines_to_keep = []
+                    file_deleted = 0
+                    
+                    with open(file_path, "r", encoding="utf-8") as f:
+                        for line in f:
+                            if line.strip():
+                                try:
+                                    record = json.loads(line.strip())
+                                except json.JSONDecodeError:
+                                    # 保留无法解析的行
+                                    lines_to_keep.append(line)
+                                    continue
+                                if match(record):
+                                    file_deleted += 1
                                 else:
                                     lines_to_keep.append(line)
-                            except json.JSONDecodeError:
-                                # 保留无法解析的行
-                                lines_to_keep.append(line)
-                
-                # 如果找到了记录，重写文件
-                if found_record:
-                    if lines_to_keep:
-                        # 有其他记录，重写文件
-                        with open(file_path, "w", encoding="utf-8") as f:
-                            f.writelines(lines_to_keep)
-                    else:
-                        # 文件为空，删除文件
-                        os.remove(file_path)
-                    break
                     
-            except Exception as e:
-                self.logger.warning(f"⚠️ 处理文件失败: {file_path}: {e}")
-                continue
+                    if file_deleted:
+                        if lines_to_keep:
+                            with open(file_path, "w", encoding="utf-8") as f:
+                                f.writelines(lines_to_keep)
+                        else:
+                            os.remove(file_path)
+                        deleted_count += file_deleted
+                        
+                except Exception as e:
+                    self.logger.warning(f"⚠️ 处理文件失败: {file_path}: {e}")
+                    continue
         
-        return deleted
+        return deleted_count
 
 # 全局实例
 _history_manager = None
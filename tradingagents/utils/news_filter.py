@@ -6,6 +6,7 @@
 import pandas as pd
 import re
 import logging
+from functools import lru_cache
 from typing import List, Dict, Tuple, Optional
 from datetime import datetime
 import requests
@@ -13,9 +14,87 @@ import json
 
 logger = logging.getLogger(__name__)
 
+# 简化的公司名称映射（实际项目中可以从数据库或API获取）
+_COMPANY_MAP: Dict[str, str] = {
+    '000001': '平安银行',
+    '000002': '万科A',
+    '600036': '招商银行',
+    '600519': '贵州茅台',
+    '000858': '五粮液',
+    '600276': '恒瑞医药',
+    # 可以继续添加更多映射...
+}
+
+# 股票代码的交易所后缀
+_SUFFIX_RE = re.compile(r'\.(SH|SZ|SS|XSHE|XSHG)$')
+
+# 强关键词得分上限，以及一般关键词+内容+标题质量的得分上限（用于提前剪枝）
+_MAX_STRONG_SCORE = 30
+_MAX_REMAINING_SCORE = 15 + 5 + 3 + 2
+
+# 公司名称中可去掉的常见后缀
+_COMPANY_NAME_SUFFIXES = ('股份有限公司', '有限公司', '集团', '控股', '科技', '实业')
+
+
+@lru_cache(maxsize=4096)
+def _build_company_patterns_cached(stock_code: str, company_name: str) -> Tuple[str, ...]:
+    """按 (股票代码, 公司名称) 缓存的公司正则模式"""
+    patterns = []
+    
+    # 基础公司名称
+    if company_name:
+        # 完整公司名称
+        patterns.append(re.escape(company_name))
+        
+        # 去掉常见后缀的公司名称
+        for suffix in _COMPANY_NAME_SUFFIXES:
+            short_name = company_name.replace(suffix, '')
+            if len(short_name) >= 2:
+                patterns.append(re.escape(short_name))
+    
+    # 股票代码
+    patterns.append(re.escape(stock_code))
+    
+    return tuple(patterns)
+
+
+@lru_cache(maxsize=4096)
+def _compile_company_regex(patterns: Tuple[str, ...]) -> re.Pattern:
+    """将公司模式合并编译为单个正则"""
+    return re.compile('|'.join(patterns), re.IGNORECASE)
+
+
 class NewsRelevanceFilter:
     """新闻相关性过滤器"""
     
+    # 关键词与具体股票无关，作为类属性在所有实例间共享
+    # 强相关关键词（高权重）
+    strong_keywords = (
+        '业绩', '财报', '年报', '季报', '营收', '利润', '净利润', '收益',
+        '股价', '涨停', '跌停', '涨幅', '跌幅', '成交量', '市值',
+        '分红', '送股', '配股', '增发', '回购', '减持', '增持',
+        '重组', '并购', '收购', '投资', '合作', '签约', '中标',
+        '上市', '退市', '停牌', '复牌', '公告', '披露'
+    )
+    
+    # 一般相关关键词（中等权重）
+    include_keywords = (
+        '股票', '证券', '投资', '基金', '机构', '券商',
+        '行业', '市场', '经济', '政策', '监管', '规划',
+        '技术', '创新', '研发', '专利', '产品', '服务',
+        '管理', '团队', '董事', '高管', '员工', '人事'
+    )
+    
+    # 排除关键词（负权重）
+    exclude_keywords = (
+        '娱乐', '体育', '游戏', '影视', '明星', '网红',
+        '旅游', '美食', '时尚', '购物', '生活', '健康',
+        '天气', '交通', '房产', '教育', '婚恋', '社交',
+        '其他公司', '竞争对手', '无关', '广告', '推广'
+    )
+    
+    _base_keywords = None
+    
     def __init__(self, stock_code: str, company_name: str):
         """
         初始化过滤器
@@ -27,63 +106,37 @@ class NewsRelevanceFilter:
         self.stock_code = stock_code
         self.company_name = company_name
         
-        # 强相关关键词（高权重）
-        self.strong_keywords = [
-            '业绩', '财报', '年报', '季报', '营收', '利润', '净利润', '收益',
-            '股价', '涨停', '跌停', '涨幅', '跌幅', '成交量', '市值',
-            '分红', '送股', '配股', '增发', '回购', '减持', '增持',
-            '重组', '并购', '收购', '投资', '合作', '签约', '中标',
-            '上市', '退市', '停牌', '复牌', '公告', '披露'
-        ]
-        
-        # 一般相关关键词（中等权重）
-        self.include_keywords = [
-            '股票', '证券', '投资', '基金', '机构', '券商',
-            '行业', '市场', '经济', '政策', '监管', '规划',
-            '技术', '创新', '研发', '专利', '产品', '服务',
-            '管理', '团队', '董事', '高管', '员工', '人事'
-        ]
-        
-        # 排除关键词（负权重）
-        self.exclude_keywords = [
-            '娱乐', '体育', '游戏', '影视', '明星', '网红',
-            '旅游', '美食', '时尚', '购物', '生活', '健康',
-            '天气', '交通', '房产', '教育', '婚恋', '社交',
-            '其他公司', '竞争对手', '无关', '广告', '推广'
-        ]
-        
         # 公司名称相关模式
         self.company_patterns = self._build_company_patterns()
+        # 公司模式合并为一个正则，只在初始化时编译一次
+        self._company_regex = _compile_company_regex(tuple(self.company_patterns))
         
         logger.info(f"[新闻过滤器] 初始化完成 - 股票代码: {stock_code}, 公司: {company_name}")
     
+    @classmethod
+    def _get_base_keywords(cls) -> Dict[str, Tuple[str, ...]]:
+        """获取共享的小写关键词表（首次调用时构建）"""
+        if cls._base_keywords is None:
+            cls._base_keywords = {
+                'strong': tuple(k.lower() for k in cls.strong_keywords),
+                'include': tuple(k.lower() for k in cls.include_keywords),
+                'exclude': tuple(k.lower() for k in cls.exclude_keywords),
+            }
+        return cls._base_keywords
+    
     def _build_company_patterns(self) -> List[str]:
         """构建公司名称相关的正则模式"""
-        patterns = []
-        
-        # 基础公司名称
-        if self.company_name:
-            # 完整公司名称
-            patterns.append(re.escape(self.company_name))
-            
-            # 去掉常见后缀的公司名称
-            for suffix in ['股份有限公司', '有限公司', '集团', '控股', '科技', '实业']:
-                short_name = self.company_name.replace(suffix, '')
-                if len(short_name) >= 2:
-                    patterns.append(re.escape(short_name))
-        
-        # 股票代码
-        patterns.append(re.escape(self.stock_code))
-        
-        return patterns
+        return list(_build_company_patterns_cached(self.stock_code, self.company_name))
     
-    def calculate_relevance_score(self, title: str, content: str) -> Tuple[float, Dict]:
+    def calculate_relevance_score(self, title: str, content: str,
+                                  min_score: Optional[float] = None) -> Tuple[float, Dict]:
         """
         计算新闻相关性评分
         
         Args:
             title: 新闻标题
             content: 新闻内容
+            min_score: 最低评分阈值（可选），可达到的最高分低于该值时提前返回0分
             
         Returns:
             Tuple[float, Dict]: (评分, 详细信息)
@@ -104,25 +157,36 @@ class NewsRelevanceFilter:
         content_lower = content.lower() if content else ""
         full_text_lower = full_text.lower()
         
+        base_keywords = self._get_base_keywords()
+        
         # 1. 公司名称和股票代码匹配（高权重）
         company_score = 0
-        for pattern in self.company_patterns:
-            if re.search(pattern, full_text, re.IGNORECASE):
-                company_score += 30
-                details['company_match'] = True
-                break
+        if self._company_regex.search(full_text):
+            company_score += 30
+            details['company_match'] = True
         
         # 标题中包含公司信息额外加分
-        for pattern in self.company_patterns:
-            if re.search(pattern, title, re.IGNORECASE):
-                company_score += 20
-                break
+        if self._company_regex.search(title):
+            company_score += 20
         
         score += min(company_score, 50)  # 公司相关性最高50分
         
-        # 2. 强相关关键词匹配
+        # 2. 排除关键词惩罚
+        exclude_penalty = 0
+        for keyword in base_keywords['exclude']:
+            if keyword in full_text_lower:
+                exclude_penalty += 10
+                details['exclude_keywords'].append(keyword)
+        
+        score -= min(exclude_penalty, 20)  # 排除关键词最多扣20分
+        
+        # 已确定公司和排除项后，剩余各项全部取满分仍达不到阈值则提前返回
+        if min_score is not None and score + _MAX_STRONG_SCORE + _MAX_REMAINING_SCORE < min_score:
+            return 0.0, details
+        
+        # 3. 强相关关键词匹配
         strong_score = 0
-        for keyword in self.strong_keywords:
+        for keyword in base_keywords['strong']:
             if keyword in full_text_lower:
                 strong_score += 15
                 details['strong_keywords'].append(keyword)
@@ -133,24 +197,18 @@ class NewsRelevanceFilter:
         
         score += min(strong_score, 30)  # 强关键词最高30分
         
-        # 3. 一般关键词匹配
+        if min_score is not None and score + _MAX_REMAINING_SCORE < min_score:
+            return 0.0, details
+        
+        # 4. 一般关键词匹配
         include_score = 0
-        for keyword in self.include_keywords:
+        for keyword in base_keywords['include']:
             if keyword in full_text_lower:
                 include_score += 5
                 details['include_keywords'].append(keyword)
         
         score += min(include_score, 15)  # 一般关键词最高15分
         
-        # 4. 排除关键词惩罚
-        exclude_penalty = 0
-        for keyword in self.exclude_keywords:
-            if keyword in full_text_lower:
-                exclude_penalty += 10
-                details['exclude_keywords'].append(keyword)
-        
-        score -= min(exclude_penalty, 20)  # 排除关键词最多扣20分
-        
         # 5. 内容长度和质量评估
         if content:
             content_length = len(content)
@@ -204,7 +262,7 @@ class NewsRelevanceFilter:
             content = str(row.get('新闻内容', '')) if pd.notna(row.get('新闻内容', '')) else ''
             
             # 计算相关性评分
-            score, details = self.calculate_relevance_score(title, content)
+            score, details = self.calculate_relevance_score(title, content, min_score)
             
             # 如果评分达到阈值，保留该条新闻
             if score >= min_score:
@@ -269,6 +327,7 @@ class NewsRelevanceFilter:
         return stats
 
 
+@lru_cache(maxsize=4096)
 def get_company_name(stock_code: str) -> str:
     """
     根据股票代码获取公司名称
@@ -279,22 +338,10 @@ def get_company_name(stock_code: str) -> str:
     Returns:
         str: 公司名称
     """
-    # 简化的公司名称映射（实际项目中可以从数据库或API获取）
-    company_map = {
-        '000001': '平安银行',
-        '000002': '万科A',
-        '600036': '招商银行',
-        '600519': '贵州茅台',
-        '000858': '五粮液',
-        '600276': '恒瑞医药',
-        # 可以继续添加更多映射...
-    }
-    
     # 清理股票代码
-    clean_code = stock_code.replace('.SH', '').replace('.SZ', '').replace('.SS', '') \
-                          .replace('.XSHE', '').replace('.XSHG', '')
+    clean_code = _SUFFIX_RE.sub('', stock_code)
     
-    return company_map.get(clean_code, f"股票{clean_code}")
+    return _COMPANY_MAP.get(clean_code, f"股票{clean_code}")
 
 
 def create_news_filter(stock_code: str, company_name: str = None) -> NewsRelevanceFilter:
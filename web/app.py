@@ -26,10 +26,10 @@ load_dotenv(project_root / ".env", override=True)
 # 导入自定义组件
 from components.sidebar import render_sidebar
 from components.header import render_header
-from components.analysis_form import render_analysis_form
+from components.analysis_form import render_analysis_form, parse_batch_symbols
 from components.results_display import render_results
 from utils.api_checker import check_api_keys
-from utils.analysis_runner import run_stock_analysis, validate_analysis_params, format_analysis_results
+from utils.analysis_runner import run_stock_analysis, validate_analysis_params, validate_global_params, format_analysis_results
 from utils.progress_tracker import StreamlitProgressDisplay, create_progress_callback
 
 # 设置页面配置
@@ -590,35 +590,35 @@ def main():
             # 检查是否是批量分析模式
             if form_data.get('analysis_mode') == '批量分析':
                 # 处理批量分析
-                from utils.batch_processor import get_batch_processor
                 from components.batch_analysis_ui import start_batch_analysis
                 
-                processor = get_batch_processor()
+                market_type = form_data.get('market_type', '美股')
+                if not isinstance(market_type, str):
+                    market_type = '美股'
+                
+                # 与表单预览使用同一解析，格式不符的代码不提交分析
                 stock_input = form_data.get('stock_symbol', '')
                 if isinstance(stock_input, str):
-                    symbols = processor.parse_stock_symbols(stock_input)
+                    symbols, rejected = parse_batch_symbols(stock_input, market_type)
                 else:
-                    symbols = []
+                    symbols, rejected = [], []
+                
+                if rejected:
+                    st.warning(f"⚠️ 以下输入不符合{market_type}代码格式，已忽略: {', '.join(rejected)}")
                 
                 if not symbols:
                     st.error("❌ 未识别到有效的股票代码，请检查输入格式")
                 elif len(symbols) > 20:
                     st.error(f"❌ 一次最多支持分析20个股票代码，当前输入了{len(symbols)}个")
                 else:
-                    # 验证第一个股票代码的参数（作为样本验证）
-                    market_type = form_data.get('market_type', '美股')
-                    if not isinstance(market_type, str):
-                        market_type = '美股'
-                        
-                    is_valid, validation_errors = validate_analysis_params(
-                        stock_symbol=symbols[0],
-                        analysis_date=form_data['analysis_date'],
-                        analysts=form_data['analysts'],
-                        research_depth=form_data['research_depth'],
-                        market_type=market_type
+                    # 代码格式已在解析时逐个校验，这里只需验证与股票代码无关的参数
+                    validation_errors = validate_global_params(
+                        form_data['analysis_date'],
+                        form_data['analysts'],
+                        form_data['research_depth']
                     )
                     
-                    if not is_valid:
+                    if validation_errors:
                         st.error("❌ 分析参数验证失败：")
                         for error in validation_errors:
                             st.error(f"  • {error}")
@@ -626,9 +626,8 @@ def main():
                         # 启动批量分析，传递LLM配置
                         success = start_batch_analysis(symbols, form_data, config)
                         if success:
-                            # 设置批量分析模式标志
+                            # 设置批量分析模式标志，下方的监控界面在本次运行中即会显示
                             st.session_state.batch_analysis_active = True
-                            st.rerun()
             else:
                 # 原有的单个分析逻辑
                 market_type = form_data.get('market_type', '美股')
@@ -721,16 +720,11 @@ def main():
         if st.session_state.get('batch_analysis_active', False):
             st.markdown("---")
             from components.batch_analysis_ui import render_batch_analysis_monitor, render_batch_analysis_help
-            render_batch_analysis_monitor()
+            status = render_batch_analysis_monitor()
             render_batch_analysis_help()
             
-            # 检查批量分析是否完成
-            from utils.batch_processor import get_batch_processor
-            processor = get_batch_processor()
-            status = processor.get_progress_status()
-            
+            # 复用监控界面获取的状态：批量分析已结束且没有任务时清除标志
             if not status['is_running'] and status['total_tasks'] == 0:
-                # 批量分析已完成且无任务，清除标志
                 st.session_state.batch_analysis_active = False
         
         # 显示分析结果
@@ -2,19 +2,146 @@
 分析表单组件
 """
 
+import logging
+import re
 import streamlit as st
+import streamlit.components.v1 as components
 import datetime
+from typing import List, Tuple
 
 # 导入日志模块
 from tradingagents.utils.logging_manager import get_logger
 logger = get_logger('web')
 
 
+# 批量输入的分隔符之间的单个代码，以及各市场的代码格式（与validate_analysis_params一致）
+_TOKEN_RE = re.compile(r"[^,;\s]+")
+_US_RE = re.compile(r"[A-Z]{1,5}")
+_CN_RE = re.compile(r"\d{6}")
+_HK_RE = re.compile(r"\d{4,5}(?:\.HK)?")
+_MARKET_RES = {"美股": _US_RE, "A股": _CN_RE, "港股": _HK_RE}
+
+
+# 各市场股票代码输入框的固定文案与控件key
+_MARKET_INPUTS = {
+    "美股": {
+        "key": "us_stock_input",
+        "placeholder": "输入美股代码，如 AAPL, TSLA, MSFT，然后按回车确认",
+        "help": "输入要分析的美股代码，输入完成后请按回车键确认",
+        "batch_placeholder": "输入多个美股代码，可用逗号、空格或换行分隔\n例如：\nAAPL, TSLA, MSFT\nGOOGL\nAMZN, NVDA",
+        "batch_help": "支持多种分隔符：逗号、空格、换行。系统会自动去重并验证代码格式。",
+    },
+    "A股": {
+        "key": "cn_stock_input",
+        "placeholder": "输入A股代码，如 000001, 600519，然后按回车确认",
+        "help": "输入要分析的A股代码，如 000001(平安银行), 600519(贵州茅台)，输入完成后请按回车键确认",
+        "batch_placeholder": "输入多个A股代码，可用逗号、空格或换行分隔\n例如：\n000001, 600519, 000002\n002415\n300750, 688981",
+        "batch_help": "支持多种分隔符：逗号、空格、换行。系统会自动去重并验证代码格式。",
+    },
+    "港股": {
+        "key": "hk_stock_input",
+        "placeholder": "输入港股代码，如 0700.HK, 9988.HK, 3690.HK，然后按回车确认",
+        "help": "输入要分析的港股代码，如 0700.HK(腾讯控股), 9988.HK(阿里巴巴), 3690.HK(美团)，输入完成后请按回车键确认",
+        "batch_placeholder": "输入多个港股代码，可用逗号、空格或换行分隔\n例如：\n0700.HK, 9988.HK, 3690.HK\n1810.HK\n2318.HK, 0005.HK",
+        "batch_help": "支持多种分隔符：逗号、空格、换行。请包含.HK后缀。",
+    },
+}
+
+
+# 输入框确认样式脚本：监听DOM变化，为新挂载的Streamlit输入框绑定一次事件
+_FORM_INPUT_SCRIPT = """
+<script>
+(function() {
+    const doc = window.parent.document;
+    const bind = () => {
+        doc.querySelectorAll('input[type="text"]:not([data-confirm-bound]), textarea:not([data-confirm-bound])').forEach(input => {
+            input.dataset.confirmBound = '1';
+            input.addEventListener('input', function() {
+                if (this.value.trim()) {
+                    this.style.borderColor = '#00ff00';
+                    this.title = '输入已确认';
+                } else {
+                    this.style.borderColor = '';
+                    this.title = '';
+                }
+            });
+        });
+    };
+    bind();
+    new MutationObserver(bind).observe(doc.body, {childList: true, subtree: true});
+})();
+</script>
+"""
+
+
+# 分析师复选框定义：(控件key, 分析师代码, 显示标签, 默认选中, 帮助文本)
+ANALYST_DEFS = (
+    ("market_analyst", "market", "📈 市场分析师", True, "专注于技术面分析、价格趋势、技术指标"),
+    ("social_analyst", "social", "💭 社交媒体分析师", False, "分析社交媒体情绪、投资者情绪指标"),
+    ("news_analyst", "news", "📰 新闻分析师", False, "分析相关新闻事件、市场动态影响"),
+    ("fundamentals_analyst", "fundamentals", "💰 基本面分析师", True, "分析财务数据、公司基本面、估值水平"),
+)
+
+# 分析师代码与中文名称，顺序即提交时的分析师顺序
+ANALYST_NAMES = (
+    ("market", "市场分析师"),
+    ("social", "社交媒体分析师"),
+    ("news", "新闻分析师"),
+    ("fundamentals", "基本面分析师"),
+)
+
+
+@st.cache_data(show_spinner=False)
+def _analyst_summary(flags: tuple) -> str:
+    """按复选框状态缓存分析师选择摘要"""
+    names = [name for (_, name), flag in zip(ANALYST_NAMES, flags) if flag]
+    return f"已选择 {len(names)} 个分析师: {', '.join(names)}"
+
+
+def parse_batch_symbols(raw: str, market: str) -> Tuple[List[str], List[str]]:
+    """按市场解析并校验批量股票代码，返回 (有效代码, 格式不符的输入)，去重时保留输入顺序
+
+    表单预览和提交时使用同一解析，预览的代码即实际提交分析的代码；未知市场（如自动识别）不做格式过滤
+    """
+    tokens = list(dict.fromkeys(_TOKEN_RE.findall(raw.upper())))
+    pattern = _MARKET_RES.get(market)
+    if pattern is None:
+        return tokens, []
+    valid, rejected = [], []
+    for token in tokens:
+        (valid if pattern.fullmatch(token) else rejected).append(token)
+    return valid, rejected
+
+
+@st.cache_data(show_spinner=False)
+def _cached_parse(raw: str, market: str) -> Tuple[tuple, tuple]:
+    """解析批量股票代码输入，按原始输入缓存，避免每次重跑重复解析"""
+    valid, rejected = parse_batch_symbols(raw, market)
+    return tuple(valid), tuple(rejected)
+
+
 def render_analysis_form():
-    """渲染股票分析表单"""
+    """渲染股票分析表单
+
+    表单主体作为fragment渲染，监控区域轮询或切换分析模式时不会重建整页控件；
+    提交数据通过 st.session_state["_form_submit"] 传回调用方。
+    """
+    if hasattr(st, 'fragment'):
+        st.fragment(_render_form_body)()
+    else:
+        _render_form_body()
+    
+    return st.session_state.pop("_form_submit", {'submitted': False})
+
+
+def _render_form_body():
+    """渲染表单控件，提交时把表单数据写入 st.session_state["_form_submit"]"""
     
     st.subheader("📋 分析配置")
     
+    # 内容不变的组件在重跑时不会重新挂载，脚本只执行一次
+    components.html(_FORM_INPUT_SCRIPT, height=0)
+    
     # 添加分析模式选择
     analysis_mode = st.radio(
         "选择分析模式 🎯",
@@ -25,9 +152,10 @@ def render_analysis_form():
     
     # 创建表单
     with st.form("analysis_form", clear_on_submit=False):
-        col1, col2 = st.columns(2)
+        # 单组两列布局：左侧为股票与日期，右侧为研究深度与分析师团队
+        cols = st.columns(2)
         
-        with col1:
+        with cols[0]:
             # 市场选择
             market_type = st.selectbox(
                 "选择市场 🌍",
@@ -37,79 +165,53 @@ def render_analysis_form():
             )
 
             # 根据分析模式显示不同的输入界面
+            cfg = _MARKET_INPUTS[market_type]
             if analysis_mode == "批量分析":
                 # 批量输入界面
-                if market_type == "美股":
-                    stock_input = st.text_area(
-                        "批量股票代码 📈",
-                        placeholder="输入多个美股代码，可用逗号、空格或换行分隔\n例如：\nAAPL, TSLA, MSFT\nGOOGL\nAMZN, NVDA",
-                        height=100,
-                        help="支持多种分隔符：逗号、空格、换行。系统会自动去重并验证代码格式。"
-                    )
-                elif market_type == "港股":
-                    stock_input = st.text_area(
-                        "批量股票代码 📈",
-                        placeholder="输入多个港股代码，可用逗号、空格或换行分隔\n例如：\n0700.HK, 9988.HK, 3690.HK\n1810.HK\n2318.HK, 0005.HK",
-                        height=100,
-                        help="支持多种分隔符：逗号、空格、换行。请包含.HK后缀。"
-                    )
-                else:  # A股
-                    stock_input = st.text_area(
-                        "批量股票代码 📈",
-                        placeholder="输入多个A股代码，可用逗号、空格或换行分隔\n例如：\n000001, 600519, 000002\n002415\n300750, 688981",
-                        height=100,
-                        help="支持多种分隔符：逗号、空格、换行。系统会自动去重并验证代码格式。"
-                    )
+                stock_input = st.text_area(
+                    "批量股票代码 📈",
+                    placeholder=cfg["batch_placeholder"],
+                    height=100,
+                    help=cfg["batch_help"]
+                )
                 
-                # 解析并预览股票代码
-                if stock_input:
-                    from utils.batch_processor import get_batch_processor
-                    processor = get_batch_processor()
-                    symbols = processor.parse_stock_symbols(stock_input)
-                    
-                    if symbols:
-                        st.success(f"✅ 已识别 {len(symbols)} 个股票代码")
-                        if len(symbols) <= 10:
-                            st.info(f"📋 代码列表: {', '.join(symbols)}")
-                        else:
-                            st.info(f"� 代码列表: {', '.join(symbols[:10])} ... (共{len(symbols)}个)")
-                        
-                        # 估算分析时间
-                        estimated_time = len(symbols) * 12  # 每个股票约12分钟
-                        st.warning(f"⏱️ 预估总耗时: {estimated_time // 60}小时{estimated_time % 60}分钟 (可并发分析，实际时间会短一些)")
+                # 只解析一次，预览和底部状态提示共用
+                symbols, rejected = _cached_parse(stock_input, market_type) if stock_input else ((), ())
+                
+                # 预览股票代码
+                if symbols:
+                    st.success(f"✅ 已识别 {len(symbols)} 个股票代码")
+                    if len(symbols) <= 10:
+                        st.info(f"📋 代码列表: {', '.join(symbols)}")
                     else:
-                        st.error("❌ 未识别到有效的股票代码")
+                        st.info(f"📋 代码列表: {', '.join(symbols[:10])} ... (共{len(symbols)}个)")
+                    
+                    # 估算分析时间
+                    estimated_time = len(symbols) * 12  # 每个股票约12分钟
+                    st.warning(f"⏱️ 预估总耗时: {estimated_time // 60}小时{estimated_time % 60}分钟 (可并发分析，实际时间会短一些)")
+                elif stock_input:
+                    st.error("❌ 未识别到有效的股票代码")
+                
+                # 格式不符的代码不会提交分析，明确告知用户
+                if rejected:
+                    st.warning(f"⚠️ 以下输入不符合{market_type}代码格式，将被忽略: {', '.join(rejected)}")
                 
                 stock_symbol = stock_input  # 用于后续处理
                 
             else:
                 # 单个分析模式（原有逻辑）
-                if market_type == "美股":
-                    stock_symbol = st.text_input(
-                        "股票代码 📈",
-                        placeholder="输入美股代码，如 AAPL, TSLA, MSFT，然后按回车确认",
-                        help="输入要分析的美股代码，输入完成后请按回车键确认",
-                        key="us_stock_input",
-                        autocomplete="off"
-                    ).upper().strip()
-                elif market_type == "港股":
-                    stock_symbol = st.text_input(
-                        "股票代码 📈",
-                        placeholder="输入港股代码，如 0700.HK, 9988.HK, 3690.HK，然后按回车确认",
-                        help="输入要分析的港股代码，如 0700.HK(腾讯控股), 9988.HK(阿里巴巴), 3690.HK(美团)，输入完成后请按回车键确认",
-                        key="hk_stock_input",
-                        autocomplete="off"
-                    ).upper().strip()
-                else:  # A股
-                    stock_symbol = st.text_input(
-                        "股票代码 📈",
-                        placeholder="输入A股代码，如 000001, 600519，然后按回车确认",
-                        help="输入要分析的A股代码，如 000001(平安银行), 600519(贵州茅台)，输入完成后请按回车键确认",
-                        key="cn_stock_input",
-                        autocomplete="off"
-                    ).strip()
+                stock_symbol = st.text_input(
+                    "股票代码 📈",
+                    placeholder=cfg["placeholder"],
+                    help=cfg["help"],
+                    key=cfg["key"],
+                    autocomplete="off"
+                ).strip()
+                # A股代码为纯数字，仅美股和港股需要转为大写
+                if market_type != "A股":
+                    stock_symbol = stock_symbol.upper()
 
-            logger.debug(f"🔍 [FORM DEBUG] {market_type}输入返回值: '{stock_symbol}'")
+            logger.debug("🔍 [FORM DEBUG] %s输入返回值: '%s'", market_type, stock_symbol)
             
             # 分析日期
             analysis_date = st.date_input(
@@ -118,7 +220,7 @@ def render_analysis_form():
                 help="选择分析的基准日期"
             )
         
-        with col2:
+        with cols[1]:
             # 研究深度
             research_depth = st.select_slider(
                 "研究深度 🔍",
@@ -134,51 +236,19 @@ def render_analysis_form():
                 help="选择分析的深度级别，级别越高分析越详细但耗时更长"
             )
         
-        # 分析师团队选择
-        st.markdown("### 👥 选择分析师团队")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            market_analyst = st.checkbox(
-                "📈 市场分析师",
-                value=True,
-                help="专注于技术面分析、价格趋势、技术指标"
-            )
-            
-            social_analyst = st.checkbox(
-                "💭 社交媒体分析师",
-                value=False,
-                help="分析社交媒体情绪、投资者情绪指标"
-            )
-        
-        with col2:
-            news_analyst = st.checkbox(
-                "📰 新闻分析师",
-                value=False,
-                help="分析相关新闻事件、市场动态影响"
-            )
+            # 分析师团队选择
+            st.markdown("**👥 选择分析师团队**")
             
-            fundamentals_analyst = st.checkbox(
-                "💰 基本面分析师",
-                value=True,
-                help="分析财务数据、公司基本面、估值水平"
-            )
+            analyst_flags = {}
+            for key, code, label, default, help_text in ANALYST_DEFS:
+                analyst_flags[code] = st.checkbox(label, value=default, help=help_text, key=key)
         
         # 收集选中的分析师
-        selected_analysts = []
-        if market_analyst:
-            selected_analysts.append(("market", "市场分析师"))
-        if social_analyst:
-            selected_analysts.append(("social", "社交媒体分析师"))
-        if news_analyst:
-            selected_analysts.append(("news", "新闻分析师"))
-        if fundamentals_analyst:
-            selected_analysts.append(("fundamentals", "基本面分析师"))
+        selected_analysts = [(code, name) for code, name in ANALYST_NAMES if analyst_flags[code]]
         
         # 显示选择摘要
         if selected_analysts:
-            st.success(f"已选择 {len(selected_analysts)} 个分析师: {', '.join([a[1] for a in selected_analysts])}")
+            st.success(_analyst_summary(tuple(analyst_flags[code] for code, _ in ANALYST_NAMES)))
         else:
             st.warning("请至少选择一个分析师")
         
@@ -206,41 +276,14 @@ def render_analysis_form():
         if analysis_mode == "批量分析":
             if not stock_symbol:
                 st.info("💡 请在上方输入多个股票代码，支持逗号、空格或换行分隔")
-            else:
-                from utils.batch_processor import get_batch_processor
-                processor = get_batch_processor()
-                symbols = processor.parse_stock_symbols(stock_symbol)
-                if symbols:
-                    st.success(f"✅ 准备分析 {len(symbols)} 个股票代码")
-                else:
-                    st.error("❌ 未识别到有效的股票代码")
+            elif symbols:
+                st.success(f"✅ 准备分析 {len(symbols)} 个股票代码")
         else:
             if not stock_symbol:
                 st.info("💡 请在上方输入股票代码，输入完成后按回车键确认")
             else:
                 st.success(f"✅ 已输入股票代码: {stock_symbol}")
 
-        # 添加JavaScript来改善用户体验
-        st.markdown("""
-        <script>
-        // 监听输入框的变化，提供更好的用户反馈
-        document.addEventListener('DOMContentLoaded', function() {
-            const inputs = document.querySelectorAll('input[type="text"], textarea');
-            inputs.forEach(input => {
-                input.addEventListener('input', function() {
-                    if (this.value.trim()) {
-                        this.style.borderColor = '#00ff00';
-                        this.title = '输入已确认';
-                    } else {
-                        this.style.borderColor = '';
-                        this.title = '';
-                    }
-                });
-            });
-        });
-        </script>
-        """, unsafe_allow_html=True)
-
         # 根据分析模式显示不同的提交按钮
         if analysis_mode == "批量分析":
             submitted = st.form_submit_button(
@@ -256,17 +299,8 @@ def render_analysis_form():
                 use_container_width=True
             )
 
-    # 只有在提交时才返回数据
+    # 只有在提交时才传回数据
     if submitted and stock_symbol:  # 确保有股票代码才提交
-        # 添加详细日志
-        logger.debug(f"🔍 [FORM DEBUG] ===== 分析表单提交 =====")
-        logger.debug(f"🔍 [FORM DEBUG] 分析模式: '{analysis_mode}'")
-        logger.debug(f"🔍 [FORM DEBUG] 用户输入的股票代码: '{stock_symbol}'")
-        logger.debug(f"🔍 [FORM DEBUG] 市场类型: '{market_type}'")
-        logger.debug(f"🔍 [FORM DEBUG] 分析日期: '{analysis_date}'")
-        logger.debug(f"🔍 [FORM DEBUG] 选择的分析师: {[a[0] for a in selected_analysts]}")
-        logger.debug(f"🔍 [FORM DEBUG] 研究深度: {research_depth}")
-
         form_data = {
             'submitted': True,
             'analysis_mode': analysis_mode,
@@ -280,14 +314,15 @@ def render_analysis_form():
             'custom_prompt': custom_prompt
         }
 
-        logger.debug(f"🔍 [FORM DEBUG] 返回的表单数据: {form_data}")
-        logger.debug(f"🔍 [FORM DEBUG] ===== 表单提交结束 =====")
+        # 添加详细日志（仅在DEBUG级别启用时格式化）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔍 [FORM DEBUG] 分析表单提交，返回的表单数据: %s", form_data)
 
-        return form_data
+        st.session_state["_form_submit"] = form_data
+        # fragment内的提交只会局部重跑，需整页重跑让调用方处理提交
+        if hasattr(st, 'fragment'):
+            st.rerun()
     elif submitted and not stock_symbol:
         # 用户点击了提交但没有输入股票代码
-        logger.error(f"🔍 [FORM DEBUG] 提交失败：股票代码为空")
+        logger.error("🔍 [FORM DEBUG] 提交失败：股票代码为空")
         st.error("❌ 请输入股票代码后再提交")
-        return {'submitted': False}
-    else:
-        return {'submitted': False}
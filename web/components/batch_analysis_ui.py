@@ -5,10 +5,7 @@
 """
 
 import streamlit as st
-import time
-from datetime import datetime, timedelta
-import pandas as pd
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 
 # 导入日志模块
 from tradingagents.utils.logging_manager import get_logger
@@ -16,13 +13,34 @@ logger = get_logger('batch_ui')
 
 from utils.batch_processor import get_batch_processor
 
+# 旧版Streamlit没有fragment时，用浏览器端定时器驱动刷新
+try:
+    from streamlit_autorefresh import st_autorefresh
+    AUTOREFRESH_AVAILABLE = True
+except ImportError:
+    AUTOREFRESH_AVAILABLE = False
 
-def render_batch_analysis_monitor():
-    """渲染批量分析监控界面 - 改进版支持自动刷新"""
+# 结果表格可选的显示行数及默认值
+RESULTS_PAGE_SIZES = (20, 50, 200, "全部")
+RESULTS_PREVIEW_ROWS = 50
+
+# 自动刷新间隔范围（秒）
+MIN_REFRESH_INTERVAL = 2.0
+MAX_REFRESH_INTERVAL = 15.0
+
+
+def render_batch_analysis_monitor() -> Dict[str, Any]:
+    """渲染批量分析监控界面 - 进度区域使用fragment局部自动刷新
+    
+    返回本次获取的进度状态，调用方直接复用，无需再次查询处理器
+    """
     
     processor = get_batch_processor()
     status = processor.get_progress_status()
     
+    if st.session_state.pop('_batch_stop_requested', False):
+        st.warning("⏸️ 已请求停止所有任务")
+    
     # 初始化状态跟踪
     if 'last_batch_status' not in st.session_state:
         st.session_state.last_batch_status = {'is_running': False, 'completed_tasks': 0}
@@ -40,10 +58,109 @@ def render_batch_analysis_monitor():
     
     if not status['total_tasks'] and not status['is_running']:
         st.info("📭 暂无批量分析任务正在运行")
-        return
+        return status
     
     st.subheader("📊 批量分析进度监控")
     
+    # 运行中时的控制面板
+    auto_refresh = False
+    if status['is_running']:
+        col1, col2, col3 = st.columns([2, 1, 1])
+        
+        with col1:
+            # 自动刷新选项
+            auto_refresh = st.checkbox(
+                "🔄 自动刷新", 
+                value=st.session_state.get('batch_auto_refresh', True), 
+                key="auto_refresh_batch",
+                help="开启后自动更新进度状态"
+            )
+            st.session_state.batch_auto_refresh = auto_refresh
+        
+        with col2:
+            # 点击按钮本身就会触发重跑并获取最新状态，无需再次st.rerun()
+            st.button("🔄 立即刷新", key="manual_refresh")
+        
+        with col3:
+            # 在回调中停止任务，本次重跑开头获取的状态即为停止后的状态
+            st.button("⏸️ 停止任务", type="secondary", key="stop_tasks", on_click=_stop_all_tasks, args=(processor,))
+    
+    # 只有进度区域按间隔重跑，表单和结果表格保持不动
+    # 刷新节奏只由这里的run_every（或旧版下的_schedule_fallback_rerun）决定，
+    # 不要再注入setTimeout/location.reload之类的页面脚本，两套定时器叠加会导致重复重跑
+    # 旧版没有fragment，每次运行都由定时器触发，整页运行时即推进退避；有fragment时由fragment定时重跑推进
+    run_every = _get_refresh_interval(status, advance=not hasattr(st, 'fragment')) if auto_refresh else None
+    st.session_state._monitor_status = status
+    if hasattr(st, 'fragment'):
+        st.fragment(run_every=run_every)(_render_progress_fragment)(processor)
+    else:
+        _render_progress_fragment(processor)
+    
+    # 显示任务详情
+    _render_task_details(status)
+    
+    # 旧版Streamlit没有fragment时退化为整页定时重跑
+    if run_every and not hasattr(st, 'fragment'):
+        _schedule_fallback_rerun(run_every)
+    
+    return status
+
+
+def _stop_all_tasks(processor):
+    """停止任务按钮回调：停止任务（处理器同时丢弃缓存的进度状态）"""
+    processor.stop_all_tasks()
+    st.session_state._batch_stop_requested = True
+
+
+def _schedule_fallback_rerun(interval: float):
+    """旧版Streamlit的自动刷新：由浏览器端定时器触发整页重跑，不阻塞脚本线程"""
+    if AUTOREFRESH_AVAILABLE:
+        # 只在运行中调用，任务结束后自动停止轮询
+        st_autorefresh(interval=int(interval * 1000), limit=None, key="batch_monitor_tick")
+    else:
+        st.caption("💡 当前Streamlit版本不支持自动刷新，请点击「立即刷新」查看最新进度")
+
+
+def _status_snapshot(status: Dict) -> tuple:
+    """提取用于判断是否需要整页刷新的关键字段"""
+    return (
+        status['running_tasks'],
+        status['completed_tasks'],
+        status['is_running'],
+    )
+
+
+def _get_refresh_interval(status: Dict, advance: bool = False) -> float:
+    """根据完成数变化自适应计算自动刷新间隔（秒）
+
+    有新完成的任务时按最短间隔轮询；状态稳定时，advance为True（一次定时刷新）则放慢1.5倍，
+    最长不超过上限，否则保持当前间隔
+    """
+    last_completed = st.session_state.get('_last_completed')
+    last_interval = st.session_state.get('_refresh_interval')
+    
+    if last_interval is None or status['completed_tasks'] != last_completed:
+        interval = MIN_REFRESH_INTERVAL
+    elif advance:
+        interval = min(MAX_REFRESH_INTERVAL, last_interval * 1.5)
+    else:
+        interval = last_interval
+    
+    st.session_state._last_completed = status['completed_tasks']
+    st.session_state._refresh_interval = interval
+    return interval
+
+
+def _render_progress_fragment(processor):
+    """渲染进度区域，作为fragment按间隔局部刷新"""
+    # 整页运行时复用外层已获取的状态，fragment单独重跑时再获取最新状态
+    is_fragment_run = '_monitor_status' not in st.session_state
+    status = processor.get_progress_status() if is_fragment_run else st.session_state.pop('_monitor_status')
+    # 只有fragment单独重跑时才需要与上次快照比较，决定是否触发整页刷新
+    previous = st.session_state.get('_last_monitor_snapshot') if is_fragment_run else None
+    current = _status_snapshot(status)
+    st.session_state._last_monitor_snapshot = current
+    
     # 总体进度显示
     col1, col2, col3, col4 = st.columns(4)
     
@@ -61,133 +178,31 @@ def render_batch_analysis_monitor():
         st.metric("完成率", f"{progress_pct:.1f}%")
     
     # 进度条
-    progress_bar = st.progress(progress_pct / 100.0)
+    st.progress(progress_pct / 100.0)
     
-    # 运行状态与控制
     if status['is_running']:
         st.success("🟢 批量分析正在进行中...")
         
-        # 控制面板
-        col1, col2, col3 = st.columns([2, 1, 1])
+        # 关键字段有变化时整页重跑，以更新结果表格和控制面板；完成数由处理器累计，无需按无活动时长猜测
+        if previous is not None and current != previous:
+            logger.info(f"[UI] 触发自动刷新 - 状态变化: {previous} -> {current}")
+            st.rerun()
         
-        with col1:
-            # 自动刷新选项
-            auto_refresh = st.checkbox(
-                "🔄 自动刷新", 
-                value=st.session_state.get('batch_auto_refresh', True), 
-                key="auto_refresh_batch",
-                help="开启后每5秒自动更新进度状态"
-            )
-            st.session_state.batch_auto_refresh = auto_refresh
-        
-        with col2:
-            if st.button("🔄 立即刷新", key="manual_refresh"):
-                st.rerun()
-        
-        with col3:
-            if st.button("⏸️ 停止任务", type="secondary", key="stop_tasks"):
-                processor.stop_all_tasks()
-                st.warning("⏸️ 已请求停止所有任务")
+        # fragment的run_every在注册时固定，状态未变时放慢刷新间隔，需整页重跑才能按新间隔重新注册；
+        # 间隔达到上限后不再变化，之后只有fragment按上限间隔局部刷新
+        if is_fragment_run and st.session_state.get('batch_auto_refresh', False):
+            registered = st.session_state.get('_refresh_interval')
+            if _get_refresh_interval(status, advance=True) != registered:
                 st.rerun()
         
-        # 自动刷新实现 - 智能版本基于活动时间判断
-        if auto_refresh:
-            # 检查是否需要重新刷新
-            if 'batch_refresh_timer' not in st.session_state:
-                st.session_state.batch_refresh_timer = time.time()
-            
-            current_time = time.time()
-            elapsed = current_time - st.session_state.batch_refresh_timer
-            
-            # 动态刷新间隔：更频繁的检查
-            time_since_activity = status.get('time_since_last_activity')
-            
-            # 当有任务运行时，每1-2秒检查一次；无活动时每3秒检查
-            if status['is_running'] and status['running_tasks'] > 0:
-                refresh_interval = 1  # 运行中时更频繁
-            elif time_since_activity is not None and time_since_activity < 10:
-                refresh_interval = 2  # 最近有活动时适中频率
-            else:
-                refresh_interval = 3  # 长时间无活动时较低频率
-            
-            # 检查状态变化
-            if elapsed >= refresh_interval:
-                st.session_state.batch_refresh_timer = current_time
-                
-                # 获取最新状态
-                latest_status = processor.get_progress_status()
-                
-                # 智能刷新判断：基于多种条件
-                should_refresh = False
-                refresh_reason = ""
-                
-                # 1. 任务完成状态变化
-                if latest_status['completed_tasks'] != status['completed_tasks']:
-                    should_refresh = True
-                    refresh_reason = f"任务完成数变化: {status['completed_tasks']} -> {latest_status['completed_tasks']}"
-                
-                # 2. 运行状态变化
-                elif latest_status['is_running'] != status['is_running']:
-                    should_refresh = True
-                    refresh_reason = f"运行状态变化: {status['is_running']} -> {latest_status['is_running']}"
-                
-                # 3. 检测到死线程
-                elif latest_status.get('dead_threads_detected', 0) > 0:
-                    should_refresh = True
-                    refresh_reason = f"检测到{latest_status['dead_threads_detected']}个死线程"
-                
-                # 4. 强制完成标识
-                elif latest_status.get('force_completion', False):
-                    should_refresh = True
-                    refresh_reason = "强制完成检测触发"
-                
-                # 5. 运行中任务数变化
-                elif latest_status['running_tasks'] != status['running_tasks']:
-                    should_refresh = True
-                    refresh_reason = f"运行中任务数变化: {status['running_tasks']} -> {latest_status['running_tasks']}"
-                
-                # 6. 长时间无活动后的确认检查（缩短到8秒）
-                elif (latest_status.get('time_since_last_activity') or 0) > 8 and latest_status['completed_tasks'] > 0 and latest_status['is_running']:
-                    should_refresh = True
-                    time_since = latest_status.get('time_since_last_activity') or 0
-                    refresh_reason = f"长时间无活动确认检查: {time_since:.1f}秒"
-                
-                if should_refresh:
-                    logger.info(f"[UI] 触发自动刷新 - {refresh_reason}")
-                    st.rerun()
-                else:
-                    # 显示倒计时和状态信息
-                    remaining = refresh_interval - elapsed
-                    activity_info = ""
-                    if status.get('last_activity_time'):
-                        time_since = status.get('time_since_last_activity') or 0
-                        activity_info = f" | 最后活动: {status['last_activity_time']} ({time_since:.0f}秒前)"
-                    
-                    st.info(f"⏱️ {remaining:.1f}秒后检查更新{activity_info}")
-                    
-                    # 使用客户端定时器
-                    st.markdown(f"""
-                    <script>
-                        setTimeout(function() {{
-                            window.parent.postMessage({{
-                                type: 'streamlit:rerun'
-                            }}, '*');
-                        }}, {int(remaining * 1000)});
-                    </script>
-                    """, unsafe_allow_html=True)
-            else:
-                # 显示实时状态信息
-                remaining = refresh_interval - elapsed
-                activity_info = ""
-                if status.get('last_activity_time'):
-                    time_since = status.get('time_since_last_activity') or 0
-                    activity_info = f" | 最后活动: {status['last_activity_time']} ({time_since:.0f}秒前)"
-                
-                st.info(f"⏱️ {remaining:.1f}秒后检查更新{activity_info}")
+        # 显示实时状态信息
+        if status.get('last_activity_time'):
+            time_since = status.get('time_since_last_activity') or 0
+            st.info(f"⏱️ 最后活动: {status['last_activity_time']} ({time_since:.0f}秒前)")
     else:
-        # 清理自动刷新状态
-        if 'batch_refresh_timer' in st.session_state:
-            del st.session_state.batch_refresh_timer
+        # 运行刚结束时整页重跑一次，收起控制面板并刷新结果
+        if previous is not None and previous[2]:
+            st.rerun()
         
         # 显示完成状态
         if status['completed_tasks'] > 0:
@@ -204,16 +219,14 @@ def render_batch_analysis_monitor():
             if completion_info:
                 st.info(f"⏰ {' | '.join(completion_info)}")
             
-            # 如果刚刚完成，显示庆祝效果
-            if st.session_state.get('batch_just_completed', False):
-                st.balloons()
+            # 如果刚刚完成，显示庆祝效果（pop消费标记，每批任务只播放一次动画）
+            if st.session_state.pop('batch_just_completed', False):
+                if not st.session_state.get('_balloons_shown', False):
+                    st.balloons()
+                    st.session_state._balloons_shown = True
                 st.success("🎉 所有股票分析已成功完成！")
-                st.session_state.batch_just_completed = False
         else:
             st.info("📭 暂无正在运行的分析任务")
-    
-    # 显示任务详情
-    _render_task_details(status)
 
 
 def _render_task_details(status: Dict):
@@ -222,47 +235,96 @@ def _render_task_details(status: Dict):
         st.markdown("---")
         st.subheader("📋 分析结果")
         
-        # 创建结果表格
-        results_data = []
-        for task in status['completed_results']:
-            duration = ""
-            if task['start_time'] and task['end_time']:
-                delta = task['end_time'] - task['start_time']
-                duration = f"{delta.total_seconds():.1f}秒"
-            
-            results_data.append({
-                "股票代码": task['symbol'],
-                "状态": "✅ 成功" if task['status'] == 'completed' else "❌ 失败",
-                "开始时间": task['start_time'].strftime("%H:%M:%S") if task['start_time'] else "-",
-                "耗时": duration,
-                "任务ID": task['task_id']
-            })
+        completed_results = status['completed_results']
+        
+        # 表格只发送选定范围内的行，历史再长每次重跑传输的数据量也有上限
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            show_n = st.select_slider(
+                "显示最近",
+                options=RESULTS_PAGE_SIZES,
+                value=RESULTS_PREVIEW_ROWS,
+                key="batch_results_show_n"
+            )
+        with col2:
+            only_failed = st.checkbox("只看失败", key="batch_results_only_failed")
         
-        if results_data:
-            df = pd.DataFrame(results_data)
+        rows = completed_results
+        if only_failed:
+            rows = [t for t in rows if t.get('status') != 'completed']
+        if show_n != "全部":
+            rows = rows[-show_n:]
+        
+        if rows:
+            # 结果表格只在显示的任务或其状态变化时重建
+            task_sig = tuple((t.get('task_id'), t.get('status')) for t in rows)
+            df = _build_results_df(task_sig, rows)
             st.dataframe(df, use_container_width=True, hide_index=True)
+            st.caption(f"显示 {len(rows)} / {len(completed_results)} 条结果")
+        else:
+            st.info("✅ 没有失败的任务")
+        
+        # 查看详细结果
+        st.markdown("### 🔍 查看详细分析结果")
+        
+        completed_tasks = [t for t in completed_results if t.get('status') == 'completed']
+        if completed_tasks:
+            # 创建选择选项（仅在完成任务变化时重建）；选项值为task_id，新任务完成时选中项保持不变
+            task_labels = _build_task_options(
+                tuple((task['task_id'], task['symbol']) for task in completed_tasks)
+            )
             
-            # 查看详细结果
-            st.markdown("### 🔍 查看详细分析结果")
-            
-            completed_tasks = [t for t in status['completed_results'] if t['status'] == 'completed']
-            if completed_tasks:
-                # 创建选择选项
-                task_options = {
-                    f"{task['symbol']} - {task['task_id'][:8]}": task 
-                    for task in completed_tasks
-                }
+            if task_labels:
+                selected_id = st.selectbox(
+                    "选择要查看的分析结果",
+                    options=list(task_labels),
+                    format_func=task_labels.get,
+                    key="batch_result_selector"
+                )
                 
-                if task_options:
-                    selected_task_key = st.selectbox(
-                        "选择要查看的分析结果",
-                        options=list(task_options.keys()),
-                        key="batch_result_selector"
-                    )
-                    
-                    if selected_task_key and st.button("📖 查看详细结果", key="view_batch_result"):
-                        selected_task = task_options[selected_task_key]
-                        _display_task_result(selected_task)
+                # 会话中只记录task_id，详细结果按需从处理器获取
+                if selected_id and st.button("📖 查看详细结果", key="view_batch_result"):
+                    st.session_state.batch_result_task_id = selected_id
+    
+    task_id = st.session_state.get('batch_result_task_id')
+    if task_id:
+        task = get_batch_processor().get_task_result(task_id)
+        if task:
+            _display_task_result(task)
+
+
+@st.cache_data(show_spinner=False)
+def _build_task_options(ids_and_symbols: Tuple[Tuple[str, str], ...]) -> Dict[str, str]:
+    """构建结果选择框选项，task_id -> 显示标签"""
+    return {task_id: f"{symbol} - {task_id[:8]}" for task_id, symbol in ids_and_symbols}
+
+
+@st.cache_data(ttl=300, max_entries=8, show_spinner=False)
+def _build_results_df(task_sig: tuple, _results: List[Dict]) -> "pd.DataFrame":
+    """构建结果表格，缓存以 (task_id, status) 序列为键，_results 不参与哈希"""
+    # 只有存在结果时才需要pandas，延迟导入以减少监控页面的冷启动开销
+    import numpy as np
+    import pandas as pd
+    
+    # 一次遍历直接按列收集，避免pandas逐个扫描字典推断结构
+    symbols, succeeded, starts, ends, ids = [], [], [], [], []
+    for task in _results:
+        symbols.append(task.get('symbol'))
+        succeeded.append(task.get('status') == 'completed')
+        starts.append(task.get('start_time'))
+        ends.append(task.get('end_time'))
+        ids.append((task.get('task_id') or "")[:8])
+    
+    start_time = pd.to_datetime(pd.Series(starts, dtype=object))
+    seconds = (pd.to_datetime(pd.Series(ends, dtype=object)) - start_time).dt.total_seconds()
+    
+    return pd.DataFrame({
+        "股票代码": symbols,
+        "状态": np.where(succeeded, "✅ 成功", "❌ 失败"),
+        "开始时间": start_time.dt.strftime("%H:%M:%S").fillna("-"),
+        "耗时": (seconds.round(1).astype(str) + "秒").where(seconds.notna(), ""),
+        "任务ID": ids,
+    })
 
 
 def _display_task_result(task: Dict):
@@ -315,9 +377,10 @@ def start_batch_analysis(symbols: List[str], analysis_params: Dict[str, Any], ll
         
         if task_ids:
             st.success(f"✅ 成功启动 {len(task_ids)} 个分析任务")
-            # 初始化自动刷新
+            # 初始化自动刷新，新批次允许再次播放完成动画
             st.session_state.batch_auto_refresh = True
-            st.session_state.batch_refresh_time = time.time()
+            st.session_state._balloons_shown = False
+            st.session_state.pop('_refresh_interval', None)
             logger.info(f"启动批量分析: {len(symbols)} 个股票代码")
             return True
         else:
@@ -6,10 +6,13 @@
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import numpy as np
 from datetime import datetime, timedelta
+import csv
+import io
 import json
+import math
+import re
 from typing import List, Dict, Any
 import sys
 from pathlib import Path
@@ -18,6 +21,13 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
 
+# Parquet导出依赖pyarrow（Streamlit自身已依赖），不可用时只提供CSV
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
 # 导入历史记录管理器
 try:
     from tradingagents.utils.analysis_history import get_history_manager
@@ -26,6 +36,86 @@ except ImportError as e:
     HISTORY_AVAILABLE = False
     st.error(f"历史记录模块不可用: {e}")
 
+# 记录表格每页显示的条数
+HISTORY_PAGE_SIZE = 25
+
+# 删除记录后需要清除的会话状态
+DELETE_TRACKED_KEYS = ("history_selected_for_deletion", "history_detail_record_id", "confirm_clear_all")
+
+# 高级搜索的排序方式：(排序字段, 是否升序)
+SEARCH_SORT_OPTIONS = {
+    "时间(降序)": ("created_at", False),
+    "时间(升序)": ("created_at", True),
+    "成本(降序)": ("total_cost", False),
+    "成本(升序)": ("total_cost", True)
+}
+
+# A股代码（6位数字），用于确定货币符号
+_CHINA_SYMBOL_RE = re.compile(r'^\d{6}$')
+
+
+def _paginate(records: List[Dict[str, Any]], key: str) -> List[Dict[str, Any]]:
+    """只返回当前页的记录，超过一页时显示页码选择"""
+    total_pages = math.ceil(len(records) / HISTORY_PAGE_SIZE)
+    if total_pages <= 1:
+        return records
+    
+    # 筛选条件变化后总页数可能变少，超出范围时回到最后一页
+    if st.session_state.get(key, 1) > total_pages:
+        st.session_state[key] = total_pages
+    
+    page = st.number_input(
+        f"页码（共 {total_pages} 页，{len(records)} 条记录）",
+        min_value=1,
+        max_value=total_pages,
+        key=key
+    )
+    start = (page - 1) * HISTORY_PAGE_SIZE
+    return records[start:start + HISTORY_PAGE_SIZE]
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _fetch_history(stock_symbol=None, limit=100, success_only=False, date_from=None, date_to=None,
+                   llm_provider=None, research_depth=None, failure_only=False,
+                   sort_by="created_at", ascending=False):
+    """按筛选条件缓存历史记录查询，控件交互引起的重跑不再重复访问数据库
+
+    history_manager不可哈希，在函数内部获取；删除记录后需调用 _clear_history_caches()
+    """
+    return get_history_manager().get_analysis_history(
+        stock_symbol=stock_symbol,
+        limit=limit,
+        success_only=success_only,
+        date_from=date_from,
+        date_to=date_to,
+        llm_provider=llm_provider,
+        research_depth=research_depth,
+        failure_only=failure_only,
+        sort_by=sort_by,
+        ascending=ascending
+    )
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _fetch_statistics():
+    """缓存汇总统计，统计页和管理工具的系统信息共用"""
+    return get_history_manager().get_analysis_statistics()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_chart_statistics(days=30):
+    """缓存图表所需的聚合统计"""
+    return get_history_manager().get_chart_statistics(days)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_record(record_id):
+    """缓存按ID获取的完整记录"""
+    return get_history_manager().get_analysis_record(record_id)
+
+def _clear_history_caches():
+    """记录被删除后清除查询缓存"""
+    _fetch_history.clear()
+    _fetch_statistics.clear()
+    _fetch_chart_statistics.clear()
+    _fetch_record.clear()
+
 def render_analysis_history():
     """渲染分析历史记录页面"""
     
@@ -44,20 +134,24 @@ def render_analysis_history():
         st.error(f"❌ 无法初始化历史记录管理器: {e}")
         return
     
-    # 创建标签页
-    tab1, tab2, tab3, tab4 = st.tabs(["📊 记录查看", "📈 统计分析", "🔍 详细搜索", "⚙️ 管理工具"])
-    
-    with tab1:
-        render_records_view(history_manager)
-    
-    with tab2:
-        render_statistics_view(history_manager)
-    
-    with tab3:
-        render_advanced_search(history_manager)
-    
-    with tab4:
-        render_management_tools(history_manager)
+    # 用单选切换视图代替标签页：st.tabs会在每次重跑时执行所有标签页（包括统计查询），这里只渲染当前视图
+    views = {
+        "📊 记录查看": render_records_view,
+        "📈 统计分析": render_statistics_view,
+        "🔍 详细搜索": render_advanced_search,
+        "⚙️ 管理工具": render_management_tools
+    }
+    active_view = st.radio(
+        "视图",
+        list(views),
+        horizontal=True,
+        label_visibility="collapsed",
+        key="history_active_tab"
+    )
+    
+    # 当前视图作为fragment渲染，页内控件交互只重跑当前视图
+    fragment = st.fragment if hasattr(st, 'fragment') else (lambda func: func)
+    fragment(views[active_view])(history_manager)
 
 def render_records_view(history_manager):
     """渲染记录查看界面"""
@@ -77,18 +171,12 @@ def render_records_view(history_manager):
     
     # 获取记录
     try:
-        success_only = success_filter == "仅成功"
-        if success_filter == "仅失败":
-            # 这需要在history_manager中添加failure_only参数
-            records = []  # 暂时为空，可以后续扩展
-            st.info("⚠️ '仅失败'过滤功能暂未实现")
-        else:
-            # 直接获取最新数据，不使用缓存
-            records = history_manager.get_analysis_history(
-                stock_symbol=stock_filter if stock_filter else None,
-                limit=limit,
-                success_only=success_only
-            )
+        records = _fetch_history(
+            stock_symbol=stock_filter if stock_filter else None,
+            limit=limit,
+            success_only=success_filter == "仅成功",
+            failure_only=success_filter == "仅失败"
+        )
         
         if not records:
             st.info("� 暂无分析记录")
@@ -99,12 +187,22 @@ def render_records_view(history_manager):
             """)
             return
         
+        # 只为当前页构建表格和选项
+        records = _paginate(records, key="history_records_page")
+        
         # 转换为DataFrame
         df = pd.DataFrame(records)
         
         # 格式化显示
         display_df = prepare_display_dataframe(df)
         
+        # 删除和查看详情的选项只在记录集合变化时重建
+        opts_key = tuple(r.get('record_id') for r in records)
+        if st.session_state.get('_history_opts_key') != opts_key:
+            st.session_state['_history_opts'] = build_record_options(df, records)
+            st.session_state['_history_opts_key'] = opts_key
+        delete_options, record_options = st.session_state['_history_opts']
+        
         # 添加删除功能
         st.markdown("### 🗑️ 记录管理")
         
@@ -114,26 +212,13 @@ def render_records_view(history_manager):
         with delete_col1:
             # 使用多选框让用户选择要删除的记录
             if 'record_id' in df.columns:
-                # 创建显示选项，包含股票代码、时间和状态
-                delete_options = []
-                for _, record in df.iterrows():
-                    created_at = record.get('created_at', '')
-                    if isinstance(created_at, str):
-                        created_at = created_at[:19]  # 截取到秒
-                    status = "✅" if record.get('success', False) else "❌"
-                    option_text = f"{record.get('stock_symbol', 'N/A')} - {created_at} - {status}"
-                    delete_options.append({
-                        'text': option_text,
-                        'record_id': record.get('record_id'),
-                        'index': len(delete_options)
-                    })
-                
                 # 多选组件
                 selected_for_deletion = st.multiselect(
                     "选择要删除的记录（可多选）:",
                     options=[opt['index'] for opt in delete_options],
                     format_func=lambda x: delete_options[x]['text'],
-                    help="⚠️ 删除操作不可恢复，请谨慎选择"
+                    help="⚠️ 删除操作不可恢复，请谨慎选择",
+                    key="history_selected_for_deletion"
                 )
             else:
                 st.warning("⚠️ 记录缺少ID字段，无法执行删除操作")
@@ -156,17 +241,13 @@ def render_records_view(history_manager):
                         
                         if deleted_count > 0:
                             st.success(f"✅ 成功删除了 {deleted_count} 条记录")
+                            _clear_history_caches()
                             
-                            # 清除所有session state
-                            for key in list(st.session_state.keys()):
-                                if 'selected' in key.lower() or 'confirm' in key.lower():
-                                    del st.session_state[key]
+                            # 清除与已删除记录相关的选择状态；删除是同步完成的，缓存已清除，重跑即可读到最新数据
+                            for key in DELETE_TRACKED_KEYS:
+                                st.session_state.pop(key, None)
                             
-                            # 等待一点时间确保数据库操作完成
-                            import time
-                            time.sleep(0.5)
-                            
-                            # 强制刷新页面
+                            # 删除会影响所有标签页（统计、管理工具中的记录数），因此整页刷新而非只重跑当前fragment
                             st.rerun()
                         else:
                             st.error("❌ 删除失败，请检查记录是否存在")
@@ -200,14 +281,6 @@ def render_records_view(history_manager):
             st.markdown("### 🔍 查看详细分析结果")
             
             # 创建选择框
-            record_options = []
-            for i, record in enumerate(records):
-                created_at = record.get('created_at', '')
-                if isinstance(created_at, str):
-                    created_at = created_at[:19]  # 截取到秒
-                option = f"{record.get('stock_symbol', 'N/A')} - {created_at} - {record.get('llm_provider', 'N/A')}"
-                record_options.append(option)
-            
             selected_index = st.selectbox(
                 "选择要查看的分析记录:",
                 range(len(record_options)),
@@ -215,68 +288,135 @@ def render_records_view(history_manager):
             )
             
             if st.button("📋 查看分析详情", type="primary"):
-                show_analysis_details(records[selected_index])
+                selected_record = records[selected_index]
+                if selected_record.get('record_id'):
+                    # 记住查看的记录，详情内切换报告模块引起的重跑仍能继续显示
+                    st.session_state['history_detail_record_id'] = selected_record['record_id']
+                else:
+                    show_analysis_details(selected_record)
+            
+            # 列表查询不含大字段，查看详情时再按ID取完整记录
+            detail_id = st.session_state.get('history_detail_record_id')
+            if detail_id:
+                full_record = _fetch_record(detail_id)
+                if full_record:
+                    show_analysis_details(full_record)
     
     except Exception as e:
         st.error(f"❌ 获取记录失败: {e}")
 
+def build_record_options(df, records):
+    """构建删除多选框和详情选择框的选项文本"""
+    # 删除选项，包含股票代码、时间和状态
+    delete_options = []
+    if 'record_id' in df.columns:
+        # 按列取出数组后用推导式一次构建，避免iterrows为每行构造Series
+        def column(name, default):
+            return df[name].to_numpy() if name in df.columns else [default] * len(df)
+        
+        times = [str(created_at)[:19] for created_at in column('created_at', '')]  # 截取到秒
+        rows = zip(column('stock_symbol', 'N/A'), times, column('success', False), df['record_id'].to_numpy())
+        delete_options = [
+            {'text': f"{symbol} - {created_at} - {'✅' if success else '❌'}", 'record_id': record_id, 'index': index}
+            for index, (symbol, created_at, success, record_id) in enumerate(rows)
+        ]
+    
+    # 详情选项，包含股票代码、时间和LLM提供商
+    syms = [r.get('stock_symbol', 'N/A') for r in records]
+    times = [str(r.get('created_at', ''))[:19] for r in records]  # 截取到秒
+    provs = [r.get('llm_provider', 'N/A') for r in records]
+    record_options = [f"{s} - {t} - {p}" for s, t, p in zip(syms, times, provs)]
+    
+    return delete_options, record_options
+
+# 显示列与中文列名（不包括record_id，但会保留在原始数据中用于删除）
+DISPLAY_COLUMNS = {
+    'stock_symbol': '股票代码',
+    'created_at': '分析时间',
+    'market_type': '市场类型',
+    'llm_provider': 'LLM提供商',
+    'llm_model': '模型',
+    'research_depth': '研究深度',
+    'duration': '耗时(秒)',
+    'total_cost': '成本($)',
+    'success': '状态'
+}
+
+# 显示表格中按category类型传输的列
+CATEGORY_COLUMNS = ('market_type', 'llm_provider', 'research_depth', 'success')
+
+# 研究深度的友好描述
+DEPTH_LABELS = {
+    1: '1级-快速',
+    2: '2级-基础',
+    3: '3级-标准',
+    4: '4级-深度',
+    5: '5级-极深'
+}
+
+# 兼容以字符串保存研究深度的旧记录
+_DEPTH_LOOKUP = {**DEPTH_LABELS, **{str(depth): label for depth, label in DEPTH_LABELS.items()}}
+
+# LLM提供商的显示名称
+PROVIDER_NAMES = {
+    'dashscope': '🔮 阿里百炼',
+    'deepseek': '🤖 DeepSeek',
+    'google': '🌟 Google AI',
+    'openai': '🚀 OpenAI'
+}
+
+# 分析师图标映射
+ANALYST_ICONS = {
+    'market': '📈',
+    'fundamentals': '💰',
+    'news': '📰',
+    'social_media': '💭',
+    'risk': '⚠️',
+    '牛市分析师': '🐂',
+    '熊市分析师': '🐻',
+    '交易员': '💼',
+    '投资顾问': '🎯',
+    '风险管理专家': '🛡️'
+}
+
 def prepare_display_dataframe(df):
-    """准备显示用的DataFrame"""
-    display_df = df.copy()
-    
-    # 重命名列
-    column_mapping = {
-        'stock_symbol': '股票代码',
-        'created_at': '分析时间',
-        'market_type': '市场类型',
-        'llm_provider': 'LLM提供商',
-        'llm_model': '模型',
-        'research_depth': '研究深度',
-        'duration': '耗时(秒)',
-        'total_cost': '成本($)',
-        'success': '状态'
-    }
-    
-    # 选择要显示的列（不包括record_id，但会保留在原始数据中用于删除）
-    display_columns = ['stock_symbol', 'created_at', 'market_type', 'llm_provider', 
-                      'llm_model', 'research_depth', 'duration', 'total_cost', 'success']
-    
-    # 过滤存在的列用于显示
-    available_display_columns = [col for col in display_columns if col in display_df.columns]
-    display_for_table = display_df[available_display_columns].copy()
-    
-    # 重命名显示列
-    display_for_table = display_for_table.rename(columns=column_mapping)
-    
-    # 格式化数据
-    if '分析时间' in display_for_table.columns:
-        display_for_table['分析时间'] = pd.to_datetime(display_for_table['分析时间']).dt.strftime('%Y-%m-%d %H:%M:%S')
-    
-    if '状态' in display_for_table.columns:
-        display_for_table['状态'] = display_for_table['状态'].map({True: '✅ 成功', False: '❌ 失败'})
-    
-    if '耗时(秒)' in display_for_table.columns:
-        display_for_table['耗时(秒)'] = display_for_table['耗时(秒)'].round(2)
+    """准备显示用的DataFrame，各列一次性向量化计算，不复制原始数据"""
+    columns = {}
+    for col, title in DISPLAY_COLUMNS.items():
+        if col not in df.columns:
+            continue
+        src = df[col]
+        
+        if col == 'created_at':
+            if pd.api.types.is_datetime64_any_dtype(src):
+                src = src.dt.strftime('%Y-%m-%d %H:%M:%S')
+            else:
+                # 记录中保存的是ISO格式字符串，直接截取到秒，无需逐个解析为datetime
+                src = src.str.slice(0, 19).str.replace('T', ' ', regex=False)
+        elif col == 'success':
+            src = np.where(src.fillna(False).to_numpy(dtype=bool), '✅ 成功', '❌ 失败')
+        elif col == 'duration':
+            src = src.round(2)
+        elif col == 'total_cost':
+            src = src.round(4)
+        elif col == 'research_depth':
+            # 直接按原始值查表，只有未知深度才转为字符串保留原值，避免Arrow类型转换错误
+            labels = src.map(_DEPTH_LOOKUP)
+            unknown = labels.isna()
+            if unknown.any():
+                labels = labels.mask(unknown, src[unknown].astype(str))
+            src = labels
+        
+        columns[title] = src
     
-    if '成本($)' in display_for_table.columns:
-        display_for_table['成本($)'] = display_for_table['成本($)'].round(4)
+    display_df = pd.DataFrame(columns, index=df.index)
     
-    # 修复研究深度列的数据类型问题，确保Arrow序列化兼容
-    if '研究深度' in display_for_table.columns:
-        # 将所有研究深度值转换为字符串，避免Arrow类型转换错误
-        display_for_table['研究深度'] = display_for_table['研究深度'].astype(str)
-        
-        # 可选：将数字映射为更友好的描述
-        depth_mapping = {
-            '1': '1级-快速',
-            '2': '2级-基础', 
-            '3': '3级-标准',
-            '4': '4级-深度',
-            '5': '5级-极深'
-        }
-        display_for_table['研究深度'] = display_for_table['研究深度'].map(lambda x: depth_mapping.get(str(x), str(x)))
+    # 取值较少的文本列转为category，Arrow按字典编码序列化，减小发送到前端的数据量
+    category_columns = [DISPLAY_COLUMNS[col] for col in CATEGORY_COLUMNS if DISPLAY_COLUMNS[col] in display_df.columns]
+    if category_columns:
+        display_df[category_columns] = display_df[category_columns].astype('category')
     
-    return display_for_table
+    return display_df
 
 def show_analysis_details(record):
     """显示分析详情 - 美化版本"""
@@ -310,83 +450,82 @@ def show_analysis_details(record):
     # 技术统计信息
     render_history_technical_stats(record)
 
+# 英文投资建议到中文的转换
+_ACTION_TRANSLATION = {
+    'BUY': '买入',
+    'SELL': '卖出',
+    'HOLD': '持有',
+    '买入': '买入',
+    '卖出': '卖出',
+    '持有': '持有'
+}
+
+# 投资建议对应的显示方式和图标
+_ACTION_STYLES = {
+    '买入': ('success', '📈'),
+    '卖出': ('error', '📉'),
+    '持有': ('info', '⏸️')
+}
+
+def _translate_action(action):
+    """返回投资建议的 (显示方式, 文本)，未知建议以metric显示原值"""
+    chinese_action = _ACTION_TRANSLATION.get(str(action).upper(), action)
+    style = _ACTION_STYLES.get(chinese_action)
+    if style is None:
+        return 'metric', chinese_action
+    kind, icon = style
+    return kind, f"{icon} **投资建议**: {chinese_action}"
+
+def _to_percent(value):
+    """0-1之间的小数按比例换算为百分数，其余视为已是百分数"""
+    return value * 100 if value <= 1 else value
+
+def _fmt_confidence(confidence):
+    """返回置信度的 (显示方式, 文本)"""
+    if not isinstance(confidence, (int, float)):
+        return 'metric', str(confidence)
+    confidence_pct = _to_percent(confidence)
+    kind = 'success' if confidence_pct >= 80 else 'info' if confidence_pct >= 60 else 'warning'
+    return kind, f"🎯 **置信度**: {confidence_pct:.1f}%"
+
+def _fmt_risk(risk_score):
+    """返回风险评分的 (显示方式, 文本)"""
+    if not isinstance(risk_score, (int, float)):
+        return 'metric', str(risk_score)
+    risk_pct = _to_percent(risk_score)
+    kind = 'error' if risk_pct >= 70 else 'warning' if risk_pct >= 40 else 'success'
+    return kind, f"⚠️ **风险评分**: {risk_pct:.1f}%"
+
+def _fmt_price(target_price, stock_symbol):
+    """返回目标价位的 (显示方式, 文本)，A股使用人民币符号"""
+    if not (target_price and isinstance(target_price, (int, float)) and target_price > 0):
+        return 'metric', "待分析"
+    is_china = bool(stock_symbol) and bool(_CHINA_SYMBOL_RE.match(str(stock_symbol)))
+    currency_symbol = "¥" if is_china else "$"
+    return 'info', f"🎯 **目标价位**: {currency_symbol}{target_price:.2f}"
+
+def _render_summary_item(label, kind, text):
+    """按显示方式渲染摘要项，metric时text为指标值"""
+    if kind == 'metric':
+        st.metric(label, text)
+    else:
+        getattr(st, kind)(text)
+
 def render_history_decision_summary(decision, record, stock_symbol):
     """渲染历史记录的投资决策摘要"""
     
     st.subheader("🎯 投资决策摘要")
     
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        action = decision.get('action', record.get('decision_action', 'N/A'))
-        
-        # 将英文投资建议转换为中文
-        action_translation = {
-            'BUY': '买入',
-            'SELL': '卖出', 
-            'HOLD': '持有',
-            '买入': '买入',
-            '卖出': '卖出',
-            '持有': '持有'
-        }
-        
-        chinese_action = action_translation.get(str(action).upper(), action)
-        
-        # 根据投资建议设置颜色
-        if chinese_action in ['买入', 'BUY']:
-            st.success(f"📈 **投资建议**: {chinese_action}")
-        elif chinese_action in ['卖出', 'SELL']:
-            st.error(f"📉 **投资建议**: {chinese_action}")
-        elif chinese_action in ['持有', 'HOLD']:
-            st.info(f"⏸️ **投资建议**: {chinese_action}")
-        else:
-            st.metric("投资建议", chinese_action)
-    
-    with col2:
-        confidence = decision.get('confidence', record.get('confidence', 0))
-        if isinstance(confidence, (int, float)):
-            confidence_pct = confidence * 100 if confidence <= 1 else confidence
-            confidence_str = f"{confidence_pct:.1f}%"
-            
-            # 根据置信度设置颜色
-            if confidence_pct >= 80:
-                st.success(f"🎯 **置信度**: {confidence_str}")
-            elif confidence_pct >= 60:
-                st.info(f"🎯 **置信度**: {confidence_str}")
-            else:
-                st.warning(f"🎯 **置信度**: {confidence_str}")
-        else:
-            st.metric("置信度", str(confidence))
+    items = (
+        ("投资建议", _translate_action(decision.get('action', record.get('decision_action', 'N/A')))),
+        ("置信度", _fmt_confidence(decision.get('confidence', record.get('confidence', 0)))),
+        ("风险评分", _fmt_risk(decision.get('risk_score', record.get('risk_score', 0)))),
+        ("目标价位", _fmt_price(decision.get('target_price', record.get('target_price')), stock_symbol))
+    )
     
-    with col3:
-        risk_score = decision.get('risk_score', record.get('risk_score', 0))
-        if isinstance(risk_score, (int, float)):
-            risk_pct = risk_score * 100 if risk_score <= 1 else risk_score
-            risk_str = f"{risk_pct:.1f}%"
-            
-            # 根据风险评分设置颜色
-            if risk_pct >= 70:
-                st.error(f"⚠️ **风险评分**: {risk_str}")
-            elif risk_pct >= 40:
-                st.warning(f"⚠️ **风险评分**: {risk_str}")
-            else:
-                st.success(f"⚠️ **风险评分**: {risk_str}")
-        else:
-            st.metric("风险评分", str(risk_score))
-    
-    with col4:
-        target_price = decision.get('target_price', record.get('target_price'))
-        
-        # 根据股票代码确定货币符号
-        import re
-        is_china = re.match(r'^\d{6}$', str(stock_symbol)) if stock_symbol else False
-        currency_symbol = "¥" if is_china else "$"
-        
-        if target_price and isinstance(target_price, (int, float)) and target_price > 0:
-            price_display = f"{currency_symbol}{target_price:.2f}"
-            st.info(f"🎯 **目标价位**: {price_display}")
-        else:
-            st.metric("目标价位", "待分析")
+    for col, (label, (kind, text)) in zip(st.columns(4), items):
+        with col:
+            _render_summary_item(label, kind, text)
     
     # AI分析推理
     reasoning = decision.get('reasoning', record.get('reasoning', ''))
@@ -411,12 +550,7 @@ def render_history_analysis_info(record):
         
         with col2:
             llm_provider = record.get('llm_provider', 'N/A')
-            provider_name = {
-                'dashscope': '🔮 阿里百炼',
-                'deepseek': '🤖 DeepSeek',
-                'google': '🌟 Google AI',
-                'openai': '🚀 OpenAI'
-            }.get(llm_provider, f"🔧 {llm_provider}")
+            provider_name = PROVIDER_NAMES.get(llm_provider, f"🔧 {llm_provider}")
             
             llm_model = record.get('llm_model', 'N/A')
             
@@ -432,15 +566,7 @@ def render_history_analysis_info(record):
             market_type = record.get('market_type', 'N/A')
             research_depth = record.get('research_depth', 'N/A')
             
-            # 研究深度映射
-            depth_mapping = {
-                1: '1级-快速',
-                2: '2级-基础',
-                3: '3级-标准', 
-                4: '4级-深度',
-                5: '5级-极深'
-            }
-            depth_display = depth_mapping.get(research_depth, str(research_depth))
+            depth_display = _DEPTH_LOOKUP.get(research_depth, str(research_depth))
             
             st.info(f"""
             **🌐 市场类型**  
@@ -456,60 +582,26 @@ def render_history_analysis_info(record):
             success = record.get('success', False)
             
             status_display = "✅ 成功" if success else "❌ 失败"
-            status_color = "success" if success else "error"
+            show_status = st.success if success else st.error
             
-            if status_color == "success":
-                st.success(f"""
-                **⏱️ 分析耗时**  
-                {duration:.2f} 秒
-                
-                **💰 分析成本**  
-                ${total_cost:.4f}
-                
-                **📊 分析状态**  
-                {status_display}
-                """)
-            else:
-                st.error(f"""
-                **⏱️ 分析耗时**  
-                {duration:.2f} 秒
-                
-                **💰 分析成本**  
-                ${total_cost:.4f}
-                
-                **📊 分析状态**  
-                {status_display}
-                """)
+            show_status(f"""
+            **⏱️ 分析耗时**  
+            {duration:.2f} 秒
+            
+            **💰 分析成本**  
+            ${total_cost:.4f}
+            
+            **📊 分析状态**  
+            {status_display}
+            """)
         
-        # 显示分析师列表
+        # 显示分析师列表：标题与徽章合并为一条markdown，最多显示5个
         analysts = record.get('analysts', [])
         if analysts:
-            st.markdown("**👥 参与的分析师:**")
-            
-            # 分析师图标映射
-            analyst_icons = {
-                'market': '📈',
-                'fundamentals': '💰', 
-                'news': '📰',
-                'social_media': '💭',
-                'risk': '⚠️',
-                '牛市分析师': '🐂',
-                '熊市分析师': '🐻',
-                '交易员': '💼',
-                '投资顾问': '🎯',
-                '风险管理专家': '🛡️'
-            }
-            
-            # 创建分析师徽章
-            analyst_cols = st.columns(min(len(analysts), 5))
-            for i, analyst in enumerate(analysts[:5]):  # 最多显示5个
-                with analyst_cols[i]:
-                    icon = analyst_icons.get(analyst, '👤')
-                    st.markdown(f"**{icon} {analyst}**")
-            
-            # 如果分析师超过5个，显示剩余数量
+            badges = " · ".join(f"**{ANALYST_ICONS.get(analyst, '👤')} {analyst}**" for analyst in analysts[:5])
             if len(analysts) > 5:
-                st.info(f"及另外 {len(analysts) - 5} 位分析师...")
+                badges += f" · 及另外 {len(analysts) - 5} 位分析师..."
+            st.markdown(f"**👥 参与的分析师:**  \n{badges}")
 
 def render_history_detailed_analysis(state):
     """渲染历史记录的详细分析报告"""
@@ -608,13 +700,21 @@ def render_history_detailed_analysis(state):
         st.markdown(f"*{module['description']}*")
         render_analysis_content(module['content'])
     else:
-        # 多个模块时使用标签页
-        tabs = st.tabs([f"{module['icon']} {module['title']}" for module in available_modules])
-        
-        for tab, module in zip(tabs, available_modules):
-            with tab:
-                st.markdown(f"*{module['description']}*")
-                render_analysis_content(module['content'])
+        # 多个模块时用单选切换，只渲染并发送当前模块的内容（st.tabs会渲染全部标签页）
+        labels = [f"{module['icon']} {module['title']}" for module in available_modules]
+        if st.session_state.get('history_detail_module', 0) >= len(labels):
+            st.session_state['history_detail_module'] = 0
+        selected = st.radio(
+            "选择分析模块",
+            range(len(available_modules)),
+            format_func=lambda i: labels[i],
+            horizontal=True,
+            label_visibility="collapsed",
+            key="history_detail_module"
+        )
+        module = available_modules[selected]
+        st.markdown(f"*{module['description']}*")
+        render_analysis_content(module['content'])
 
 def render_analysis_content(content):
     """渲染分析内容"""
@@ -645,13 +745,12 @@ def render_history_technical_stats(record):
             # Token使用情况
             token_usage = record.get('token_usage', {})
             if token_usage:
-                st.markdown("**🔢 Token使用情况**")
-                
                 input_tokens = token_usage.get('input_tokens', 0)
                 output_tokens = token_usage.get('output_tokens', 0) 
                 total_tokens = token_usage.get('total_tokens', input_tokens + output_tokens)
                 
                 st.info(f"""
+                **🔢 Token使用情况**  
                 **输入Token**: {input_tokens:,}  
                 **输出Token**: {output_tokens:,}  
                 **总Token**: {total_tokens:,}
@@ -661,20 +760,20 @@ def render_history_technical_stats(record):
         
         with col2:
             # 记录元数据
-            st.markdown("**📋 记录元数据**")
-            
             record_id = record.get('record_id', 'N/A')
             created_at = record.get('created_at', 'N/A')
             
             st.info(f"""
+            **📋 记录元数据**  
             **记录ID**: {record_id[:8]}...  
             **创建时间**: {created_at}  
             **数据完整性**: {'✅ 完整' if record.get('results') else '⚠️ 部分'}
             """)
         
-        # 原始JSON数据
+        # 原始JSON数据：折叠的expander内容同样会发送到前端，勾选后才渲染完整记录
         with st.expander("🔍 查看完整原始数据", expanded=False):
-            st.json(record)
+            if st.checkbox("加载完整原始数据", key="history_show_raw_record"):
+                st.json(record)
 
 def render_statistics_view(history_manager):
     """渲染统计分析界面"""
@@ -682,7 +781,7 @@ def render_statistics_view(history_manager):
     
     try:
         # 获取统计信息
-        stats = history_manager.get_analysis_statistics()
+        stats = _fetch_statistics()
         
         if not stats:
             st.info("📭 暂无统计数据")
@@ -718,21 +817,21 @@ def render_statistics_view(history_manager):
                 f"{stats.get('avg_duration', 0):.1f}秒"
             )
         
-        # 获取详细记录用于图表
-        recent_records = history_manager.get_analysis_history(limit=100)
+        # 图表数据由存储端聚合，只取回分组结果
+        chart_stats = _fetch_chart_statistics()
         
-        if recent_records:
-            render_charts(recent_records)
+        if chart_stats:
+            render_charts(chart_stats)
     
     except Exception as e:
         st.error(f"❌ 获取统计信息失败: {e}")
 
-def render_charts(records):
-    """渲染图表"""
-    df = pd.DataFrame(records)
+def render_charts(chart_stats):
+    """渲染图表，输入为 get_chart_statistics 返回的聚合数据
     
-    if df.empty:
-        return
+    聚合结果只有几十行，使用Streamlit原生图表，前端负载远小于Plotly
+    """
+    daily = pd.DataFrame(chart_stats.get('daily', []), columns=['date', 'count', 'success'])
     
     # 时间序列图表
     st.markdown("### 📊 分析趋势")
@@ -741,60 +840,36 @@ def render_charts(records):
     
     with col1:
         # 分析次数趋势
-        if 'created_at' in df.columns:
-            df['date'] = pd.to_datetime(df['created_at']).dt.date
-            daily_counts = df.groupby('date').size().reset_index(name='count')
-            
-            fig = px.line(
-                daily_counts, 
-                x='date', 
-                y='count',
-                title="每日分析次数",
-                labels={'date': '日期', 'count': '分析次数'}
-            )
-            st.plotly_chart(fig, use_container_width=True)
+        if not daily.empty:
+            st.markdown("**每日分析次数**")
+            st.line_chart(daily.rename(columns={'date': '日期', 'count': '分析次数'}), x='日期', y='分析次数')
     
     with col2:
         # 成功率趋势
-        if 'success' in df.columns and 'created_at' in df.columns:
-            daily_success = df.groupby('date')['success'].agg(['count', 'sum']).reset_index()
-            daily_success['success_rate'] = (daily_success['sum'] / daily_success['count']) * 100
-            
-            fig = px.bar(
-                daily_success,
-                x='date',
-                y='success_rate',
-                title="每日成功率",
-                labels={'date': '日期', 'success_rate': '成功率(%)'}
-            )
-            st.plotly_chart(fig, use_container_width=True)
+        if not daily.empty:
+            success_rate = pd.DataFrame({
+                '日期': daily['date'],
+                '成功率(%)': daily['success'] / daily['count'] * 100
+            })
+            st.markdown("**每日成功率**")
+            st.bar_chart(success_rate, x='日期', y='成功率(%)')
     
     # 更多图表
     col3, col4 = st.columns(2)
     
     with col3:
         # LLM提供商分布
-        if 'llm_provider' in df.columns:
-            provider_counts = df['llm_provider'].value_counts()
-            
-            fig = px.pie(
-                values=provider_counts.values,
-                names=provider_counts.index,
-                title="LLM提供商分布"
-            )
-            st.plotly_chart(fig, use_container_width=True)
+        provider_counts = chart_stats.get('providers')
+        if provider_counts:
+            st.markdown("**LLM提供商分布**")
+            st.bar_chart(pd.Series(provider_counts, name='分析次数'))
     
     with col4:
         # 市场类型分布
-        if 'market_type' in df.columns:
-            market_counts = df['market_type'].value_counts()
-            
-            fig = px.pie(
-                values=market_counts.values,
-                names=market_counts.index,
-                title="市场类型分布"
-            )
-            st.plotly_chart(fig, use_container_width=True)
+        market_counts = chart_stats.get('markets')
+        if market_counts:
+            st.markdown("**市场类型分布**")
+            st.bar_chart(pd.Series(market_counts, name='分析次数'))
 
 def render_advanced_search(history_manager):
     """渲染高级搜索界面"""
@@ -814,8 +889,12 @@ def render_advanced_search(history_manager):
             value=(datetime.now() - timedelta(days=30), datetime.now()),
             max_value=datetime.now()
         )
-        research_depth = st.selectbox("研究深度", ["全部", "简单", "详细", "深度"])
-        sort_by = st.selectbox("排序方式", ["时间(降序)", "时间(升序)", "成本(降序)", "成本(升序)"])
+        research_depth = st.selectbox(
+            "研究深度",
+            ["全部", 1, 2, 3, 4, 5],
+            format_func=lambda d: DEPTH_LABELS.get(d, d)
+        )
+        sort_by = st.selectbox("排序方式", list(SEARCH_SORT_OPTIONS))
     
     # 搜索按钮
     if st.button("🔍 搜索", type="primary"):
@@ -827,46 +906,43 @@ def render_advanced_search(history_manager):
             date_from = datetime.combine(date_range[0], datetime.min.time())
             date_to = datetime.combine(date_range[1], datetime.max.time())
         
+        sort_field, ascending = SEARCH_SORT_OPTIONS[sort_by]
+        
         try:
-            records = history_manager.get_analysis_history(
+            # 过滤和排序都由存储端完成
+            records = _fetch_history(
                 stock_symbol=stock_symbol if stock_symbol else None,
                 limit=100,
                 success_only=success_status == "成功",
+                failure_only=success_status == "失败",
                 date_from=date_from,
-                date_to=date_to
+                date_to=date_to,
+                llm_provider=llm_provider if llm_provider != "全部" else None,
+                research_depth=research_depth if research_depth != "全部" else None,
+                sort_by=sort_field,
+                ascending=ascending
             )
             
-            # 额外过滤
-            if llm_provider != "全部":
-                records = [r for r in records if r.get('llm_provider') == llm_provider]
-            
-            if research_depth != "全部":
-                records = [r for r in records if r.get('research_depth') == research_depth]
-            
-            if success_status == "失败":
-                records = [r for r in records if not r.get('success', True)]
-            
-            # 排序
-            if sort_by == "时间(升序)":
-                records.sort(key=lambda x: x.get('created_at', ''))
-            elif sort_by == "成本(降序)":
-                records.sort(key=lambda x: x.get('total_cost', 0), reverse=True)
-            elif sort_by == "成本(升序)":
-                records.sort(key=lambda x: x.get('total_cost', 0))
-            
-            # 显示结果
-            if records:
-                st.success(f"🎯 找到 {len(records)} 条记录")
-                
-                # 显示结果表格
-                df = pd.DataFrame(records)
-                display_df = prepare_display_dataframe(df)
-                st.dataframe(display_df, use_container_width=True, hide_index=True)
-            else:
-                st.info("📭 未找到符合条件的记录")
+            # 保存搜索结果，翻页引起的重跑仍可显示
+            st.session_state['history_search_results'] = records
+            st.session_state.pop('history_search_page', None)
         
         except Exception as e:
             st.error(f"❌ 搜索失败: {e}")
+            st.session_state.pop('history_search_results', None)
+    
+    # 显示结果
+    if 'history_search_results' in st.session_state:
+        records = st.session_state['history_search_results']
+        if records:
+            st.success(f"🎯 找到 {len(records)} 条记录")
+            
+            # 显示结果表格（分页）
+            df = pd.DataFrame(_paginate(records, key="history_search_page"))
+            display_df = prepare_display_dataframe(df)
+            st.dataframe(display_df, use_container_width=True, hide_index=True)
+        else:
+            st.info("📭 未找到符合条件的记录")
 
 def render_management_tools(history_manager):
     """渲染管理工具界面"""
@@ -884,6 +960,7 @@ def render_management_tools(history_manager):
         if st.button("🗑️ 清理旧记录", type="secondary"):
             try:
                 deleted_count = history_manager.delete_old_records(days)
+                _clear_history_caches()
                 st.success(f"✅ 已清理 {deleted_count} 条旧记录")
             except Exception as e:
                 st.error(f"❌ 清理失败: {e}")
@@ -897,21 +974,11 @@ def render_management_tools(history_manager):
         if st.button("🗑️ 删除指定股票记录", type="secondary"):
             if stock_to_delete:
                 try:
-                    # 获取该股票的所有记录
-                    records_to_delete = history_manager.get_analysis_history(
-                        stock_symbol=stock_to_delete,
-                        limit=1000
-                    )
-                    
-                    if records_to_delete:
-                        record_ids = [r.get('record_id') for r in records_to_delete if r.get('record_id')]
-                        deleted_count = history_manager.delete_records_by_ids(record_ids)
-                        if deleted_count > 0:
-                            st.success(f"✅ 已删除股票 {stock_to_delete} 的 {deleted_count} 条记录")
-                            # 标记数据已更新
-                            st.session_state['just_deleted'] = True
-                        else:
-                            st.info(f"📭 未找到股票 {stock_to_delete} 的记录或删除失败")
+                    # 按股票代码直接删除，无需先查询出全部记录
+                    deleted_count = history_manager.delete_by_stock_symbol(stock_to_delete)
+                    if deleted_count > 0:
+                        st.success(f"✅ 已删除股票 {stock_to_delete} 的 {deleted_count} 条记录")
+                        _clear_history_caches()
                     else:
                         st.info(f"📭 未找到股票 {stock_to_delete} 的记录")
                         
@@ -929,16 +996,26 @@ def render_management_tools(history_manager):
         # 数据导出
         if st.button("📤 导出数据", type="secondary"):
             try:
-                records = history_manager.get_analysis_history(limit=1000)
+                records = history_manager.get_analysis_history(limit=1000, full=True)
                 if records:
-                    df = pd.DataFrame(records)
-                    csv = df.to_csv(index=False)
+                    file_stem = f"analysis_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
                     st.download_button(
                         label="💾 下载CSV文件",
-                        data=csv,
-                        file_name=f"analysis_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                        data=records_to_csv(records),
+                        file_name=f"{file_stem}.csv",
                         mime="text/csv"
                     )
+                    if PARQUET_AVAILABLE:
+                        # Parquet导出失败不影响已生成的CSV下载
+                        try:
+                            st.download_button(
+                                label="💾 下载Parquet文件",
+                                data=records_to_parquet(records),
+                                file_name=f"{file_stem}.parquet",
+                                mime="application/octet-stream"
+                            )
+                        except Exception as e:
+                            st.warning(f"⚠️ Parquet导出失败，请使用CSV文件: {e}")
                 else:
                     st.info("📭 暂无数据可导出")
             except Exception as e:
@@ -951,17 +1028,11 @@ def render_management_tools(history_manager):
             # 需要二次确认
             if st.session_state.get('confirm_clear_all', False):
                 try:
-                    # 获取所有记录ID
-                    all_records = history_manager.get_analysis_history(limit=10000)
-                    if all_records:
-                        record_ids = [r.get('record_id') for r in all_records if r.get('record_id')]
-                        deleted_count = history_manager.delete_records_by_ids(record_ids)
-                        if deleted_count > 0:
-                            st.success(f"✅ 已清空所有记录，共删除 {deleted_count} 条")
-                            # 标记数据已更新
-                            st.session_state['just_deleted'] = True
-                        else:
-                            st.error("❌ 清空操作失败")
+                    # 直接清空，不需要先获取记录或记录ID
+                    deleted_count = history_manager.clear_all()
+                    if deleted_count > 0:
+                        st.success(f"✅ 已清空所有记录，共删除 {deleted_count} 条")
+                        _clear_history_caches()
                     else:
                         st.info("📭 没有记录需要清空")
                     
@@ -969,7 +1040,9 @@ def render_management_tools(history_manager):
                 except Exception as e:
                     st.error(f"❌ 清空失败: {e}")
             else:
-                st.warning("⚠️ 此操作将删除所有历史记录，不可恢复！")
+                # 复用系统信息已缓存的统计，不为提示文字单独扫描全部记录
+                total_count = _fetch_statistics().get('total_analyses', 0)
+                st.warning(f"⚠️ 此操作将删除所有历史记录（约 {total_count} 条），不可恢复！")
                 clear_col1, clear_col2 = st.columns(2)
                 
                 with clear_col1:
@@ -985,7 +1058,7 @@ def render_management_tools(history_manager):
     st.markdown("### ℹ️ 系统信息")
     
     try:
-        stats = history_manager.get_analysis_statistics()
+        stats = _fetch_statistics()
         
         info_col1, info_col2 = st.columns(2)
         
@@ -1007,6 +1080,37 @@ def render_management_tools(history_manager):
     except Exception as e:
         st.error(f"❌ 获取系统信息失败: {e}")
 
+def _flatten_record(record):
+    """嵌套字段（results、token_usage、analysts等）序列化为JSON字符串，便于写入表格文件"""
+    return {
+        key: json.dumps(value, ensure_ascii=False, default=str) if isinstance(value, (dict, list)) else value
+        for key, value in record.items()
+    }
+
+def records_to_csv(records):
+    """将记录直接写为CSV字节，不经过DataFrame"""
+    # 列顺序与pd.DataFrame(records)一致：按首次出现的顺序合并所有字段
+    fieldnames = list(dict.fromkeys(key for record in records for key in record))
+    
+    # 逐行编码写入字节缓冲区，不再先生成完整的CSV字符串再整体编码
+    buffer = io.BytesIO()
+    with io.TextIOWrapper(buffer, encoding='utf-8', newline='', write_through=True) as text:
+        writer = csv.DictWriter(text, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(_flatten_record(record) for record in records)
+        return buffer.getvalue()
+
+def records_to_parquet(records):
+    """将记录写为zstd压缩的Parquet字节，体积和写入耗时都远小于CSV"""
+    df = pd.DataFrame([_flatten_record(record) for record in records])
+    # Arrow序列化兼容：object列可能混有多种类型（如research_depth既有int也有str），统一转为字符串，缺失值保持为空
+    for column in df.select_dtypes(include='object').columns:
+        df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, engine='pyarrow', compression='zstd', index=False)
+    return buffer.getvalue()
+
 # 主函数
 def main():
     """主函数"""
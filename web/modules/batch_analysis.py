@@ -5,9 +5,7 @@
 """
 
 import streamlit as st
-import time
 from datetime import datetime
-import pandas as pd
 from typing import Dict, List, Any, Optional
 
 # 导入日志模块
@@ -16,8 +14,14 @@ logger = get_logger('batch_analysis')
 
 # 导入必要的组件
 from utils.batch_processor import get_batch_processor
-from components.batch_analysis_ui import render_batch_analysis_monitor
-from utils.analysis_runner import validate_analysis_params
+from components.analysis_form import parse_batch_symbols
+
+# 各LLM提供商可选的模型（常量，避免每次重跑时重建）
+_MODEL_OPTIONS = {
+    "deepseek": ["deepseek-chat", "deepseek-coder"],
+    "dashscope": ["qwen-plus", "qwen-plus-latest", "qwen-max"],
+    "openai": ["gpt-4", "gpt-3.5-turbo"]
+}
 
 
 def render_batch_analysis_page():
@@ -35,12 +39,6 @@ def render_batch_analysis_page():
         st.json(status)
         st.write(f"当前时间: {datetime.now().strftime('%H:%M:%S')}")
         
-        # 添加死线程检测显示
-        if status.get('dead_threads_detected', 0) > 0:
-            st.warning(f"💀 检测到 {status['dead_threads_detected']} 个死线程")
-        if status.get('force_completion', False):
-            st.info("🤖 强制完成检测已触发")
-        
         if st.button("🔄 手动获取状态"):
             st.rerun()
     
@@ -50,15 +48,7 @@ def render_batch_analysis_page():
     with col1:
         st.subheader("🎯 批量分析设置")
         
-        # 股票代码输入
-        stock_symbols = st.text_area(
-            "请输入股票/基金代码",
-            placeholder="例如:\n000001\n000002\n510300\n\n多个代码请用换行或逗号分隔",
-            height=120,
-            help="支持A股、美股、港股等市场的股票和基金代码"
-        )
-        
-        # LLM配置选择
+        # LLM提供商放在表单外：模型列表依赖它，需要在选择后立即更新
         llm_provider = st.selectbox(
             "🤖 选择LLM提供商",
             options=["deepseek", "dashscope", "openai"],
@@ -66,39 +56,47 @@ def render_batch_analysis_page():
             help="选择用于分析的大语言模型提供商"
         )
         
-        # 模型选择
-        model_options = {
-            "deepseek": ["deepseek-chat", "deepseek-coder"],
-            "dashscope": ["qwen-plus", "qwen-plus-latest", "qwen-max"],
-            "openai": ["gpt-4", "gpt-3.5-turbo"]
-        }
-        
-        llm_model = st.selectbox(
-            "🔧 选择模型",
-            options=model_options.get(llm_provider, ["deepseek-chat"]),
-            help="选择具体的模型版本"
-        )
-        
-        # 分析深度
-        research_depth = st.selectbox(
-            "📊 研究深度",
-            options=[1, 2, 3, 4, 5],
-            index=2,
-            help="数值越高，分析越详细，但耗时也越长"
-        )
-        
-        # 市场类型
-        market_type = st.selectbox(
-            "🌐 市场类型",
-            options=["A股", "美股", "港股", "自动识别"],
-            index=3,
-            help="选择股票所属市场"
-        )
+        # 其余设置放在表单中，修改时不触发重跑，点击开始按钮时一次提交
+        with st.form("batch_settings", clear_on_submit=False):
+            # 股票代码输入
+            stock_symbols = st.text_area(
+                "请输入股票/基金代码",
+                placeholder="例如:\n000001\n000002\n510300\n\n多个代码请用换行或逗号分隔",
+                height=120,
+                help="支持A股、美股、港股等市场的股票和基金代码"
+            )
+            
+            # 模型选择
+            llm_model = st.selectbox(
+                "🔧 选择模型",
+                options=_MODEL_OPTIONS.get(llm_provider, ["deepseek-chat"]),
+                help="选择具体的模型版本"
+            )
+            
+            # 分析深度
+            research_depth = st.selectbox(
+                "📊 研究深度",
+                options=[1, 2, 3, 4, 5],
+                index=2,
+                help="数值越高，分析越详细，但耗时也越长"
+            )
+            
+            # 市场类型
+            market_type = st.selectbox(
+                "🌐 市场类型",
+                options=["A股", "美股", "港股", "自动识别"],
+                index=3,
+                help="选择股票所属市场"
+            )
+            
+            # 启动批量分析按钮（表单内的按钮无法按输入禁用，空输入在提交后检查）
+            submitted = st.form_submit_button("🚀 开始批量分析", type="primary")
         
-        # 启动批量分析按钮
-        if st.button("🚀 开始批量分析", type="primary", disabled=not stock_symbols.strip()):
-            # 解析股票代码
-            symbols = processor.parse_stock_symbols(stock_symbols)
+        if submitted:
+            # 解析股票代码，与分析表单使用同一解析，格式不符的代码不提交分析
+            symbols, rejected = parse_batch_symbols(stock_symbols, market_type)
+            if rejected:
+                st.warning(f"⚠️ 以下输入不符合{market_type}代码格式，已忽略: {', '.join(rejected)}")
             
             if not symbols:
                 st.error("❌ 请输入有效的股票代码")
@@ -130,7 +128,7 @@ def render_batch_analysis_page():
                     if task_ids:
                         st.success(f"✅ 已启动 {len(task_ids)} 个分析任务")
                         logger.info(f"[批量分析] 启动了 {len(symbols)} 个任务: {symbols}")
-                        st.rerun()  # 立即刷新显示监控界面
+                        # 监控界面在本次运行的后面渲染，已能显示新任务，无需整页重跑
                     else:
                         st.error("❌ 启动批量分析失败")
                         
@@ -142,6 +140,7 @@ def render_batch_analysis_page():
         st.subheader("📈 进度监控")
         
         # 渲染监控界面
+        from components.batch_analysis_ui import render_batch_analysis_monitor
         render_batch_analysis_monitor()
     
     # 添加使用说明
@@ -161,7 +160,7 @@ def render_batch_analysis_page():
         ### ⚡ 自动刷新说明
         - 开启自动刷新后，界面会每2-5秒检查一次状态
         - 系统会智能检测分析完成状态，自动更新显示
-        - 如果检测到长时间无活动，会自动确认完成状态
+        - 只有进度区域按间隔局部刷新，左侧的设置表单不会重新渲染
         
         ### 🔍 调试功能
         - 点击"调试信息"可查看详细的状态数据
@@ -4,6 +4,7 @@
 
 import sys
 import os
+import re
 import uuid
 from pathlib import Path
 from datetime import datetime
@@ -669,12 +670,19 @@ def format_analysis_results(results):
         }
     }
 
-def validate_analysis_params(stock_symbol, analysis_date, analysts, research_depth, market_type="美股"):
-    """验证分析参数"""
+# 各市场的股票代码格式
+_A_SHARE_SYMBOL_RE = re.compile(r'^\d{6}$')
+_HK_SUFFIX_SYMBOL_RE = re.compile(r'^\d{4,5}\.HK$')
+_HK_DIGIT_SYMBOL_RE = re.compile(r'^\d{4,5}$')
+_US_SYMBOL_RE = re.compile(r'^[A-Z]{1,5}$')
+
+VALID_ANALYSTS = ('market', 'social', 'news', 'fundamentals')
+
+def validate_stock_symbol(stock_symbol, market_type="美股"):
+    """验证单个股票代码，返回错误列表"""
 
     errors = []
 
-    # 验证股票代码
     if not stock_symbol or len(stock_symbol.strip()) == 0:
         errors.append("股票代码不能为空")
     elif len(stock_symbol.strip()) > 10:
@@ -684,32 +692,29 @@ def validate_analysis_params(stock_symbol, analysis_date, analysts, research_dep
         symbol = stock_symbol.strip()
         if market_type == "A股":
             # A股：6位数字
-            import re
-            if not re.match(r'^\d{6}$', symbol):
+            if not _A_SHARE_SYMBOL_RE.match(symbol):
                 errors.append("A股代码格式错误，应为6位数字（如：000001）")
         elif market_type == "港股":
-            # 港股：4-5位数字.HK 或 纯4-5位数字
-            import re
-            symbol_upper = symbol.upper()
-            # 检查是否为 XXXX.HK 或 XXXXX.HK 格式
-            hk_format = re.match(r'^\d{4,5}\.HK$', symbol_upper)
-            # 检查是否为纯4-5位数字格式
-            digit_format = re.match(r'^\d{4,5}$', symbol)
-
-            if not (hk_format or digit_format):
+            # 港股：XXXX.HK / XXXXX.HK 或纯4-5位数字
+            if not (_HK_SUFFIX_SYMBOL_RE.match(symbol.upper()) or _HK_DIGIT_SYMBOL_RE.match(symbol)):
                 errors.append("港股代码格式错误，应为4位数字.HK（如：0700.HK）或4位数字（如：0700）")
         elif market_type == "美股":
             # 美股：1-5位字母
-            import re
-            if not re.match(r'^[A-Z]{1,5}$', symbol.upper()):
+            if not _US_SYMBOL_RE.match(symbol.upper()):
                 errors.append("美股代码格式错误，应为1-5位字母（如：AAPL）")
-    
+
+    return errors
+
+def validate_global_params(analysis_date, analysts, research_depth):
+    """验证与股票代码无关的参数（批量分析时只需验证一次），返回错误列表"""
+
+    errors = []
+
     # 验证分析师列表
     if not analysts or len(analysts) == 0:
         errors.append("必须至少选择一个分析师")
     
-    valid_analysts = ['market', 'social', 'news', 'fundamentals']
-    invalid_analysts = [a for a in analysts if a not in valid_analysts]
+    invalid_analysts = [a for a in analysts if a not in VALID_ANALYSTS]
     if invalid_analysts:
         errors.append(f"无效的分析师类型: {', '.join(invalid_analysts)}")
     
@@ -719,11 +724,18 @@ def validate_analysis_params(stock_symbol, analysis_date, analysts, research_dep
     
     # 验证分析日期
     try:
-        from datetime import datetime
         datetime.strptime(analysis_date, '%Y-%m-%d')
     except ValueError:
         errors.append("分析日期格式无效，应为YYYY-MM-DD格式")
     
+    return errors
+
+def validate_analysis_params(stock_symbol, analysis_date, analysts, research_depth, market_type="美股"):
+    """验证分析参数"""
+
+    errors = validate_stock_symbol(stock_symbol, market_type)
+    errors.extend(validate_global_params(analysis_date, analysts, research_depth))
+    
     return len(errors) == 0, errors
 
 def get_supported_stocks():
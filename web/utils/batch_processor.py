@@ -4,62 +4,98 @@
 支持多个股票代码的并发分析
 """
 
+import contextlib
+import re
 import streamlit as st
 import threading
 import time
 import queue
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import traceback
 import uuid
+from collections import deque
 
 # 导入日志模块
 from tradingagents.utils.logging_manager import get_logger
 logger = get_logger('batch_processor')
 
 # 导入分析运行器
-from utils.analysis_runner import run_stock_analysis, validate_analysis_params
+from utils.analysis_runner import run_stock_analysis, validate_global_params, validate_stock_symbol
+
+# 同时运行的分析任务上限，超出的任务在线程池中排队，按LLM提供商的限流情况调整
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '4'))
+
+# 每个LLM提供商同时进行的分析上限，避免超出提供商并发限制后频繁429重试；
+# 只有小于BATCH_MAX_WORKERS时才起作用，可通过环境变量 BATCH_MAX_CONCURRENCY_<提供商> 调整，例如 BATCH_MAX_CONCURRENCY_DEEPSEEK=2
+_PROVIDER_CONCURRENCY = {'deepseek': 3, 'dashscope': 3, 'openai': 3}
+_PROVIDER_SEMS = {
+    provider: threading.BoundedSemaphore(int(os.getenv(f'BATCH_MAX_CONCURRENCY_{provider.upper()}', str(limit))))
+    for provider, limit in _PROVIDER_CONCURRENCY.items()
+}
+
+# 完成任务日志保留的最大条数，长期运行的服务进程中不会无限增长
+COMPLETED_LOG_MAXLEN = 256
+
+# 保留详细结果的已完成任务数上限，超出时丢弃最早完成的任务；应不小于单批任务数上限
+FINISHED_TASKS_MAXLEN = 100
+
+# 进度状态缓存时间（秒）：自动刷新、调试面板等在短时间内的重复查询直接复用上次结果
+STATUS_CACHE_TTL = 0.5
+
+# 股票代码分隔符：逗号、分号、空白（含换行）
+_SYMBOL_SEP = re.compile(r'[,;\s]+')
+
+
+def parse_stock_symbols(input_text: str) -> List[str]:
+    """解析股票代码输入文本"""
+    if not input_text:
+        return []
+    
+    # 支持多种分隔符：换行、逗号、分号、空格
+    symbols = _SYMBOL_SEP.split(input_text.strip())
+    
+    # 清理并按输入顺序去重
+    return list(dict.fromkeys(symbol.upper() for symbol in symbols if symbol))
 
 
 class BatchAnalysisProcessor:
     """批量分析处理器"""
     
     def __init__(self):
-        self.analysis_queue = queue.Queue()
-        self.results_queue = queue.Queue()
-        self.active_threads = {}
+        self._completion_queue = queue.SimpleQueue()  # 工作线程结束时放入任务，get_progress_status取出
+        self._executor = self._create_executor()
+        self._futures: Dict[str, Future] = {}  # task_id -> 尚未取回结果的任务
         self.is_running = False
         self.last_activity_time = None  # 记录最后活动时间
-        self.completed_tasks_log = []  # 记录完成任务的日志
+        self.completed_tasks_log = deque(maxlen=COMPLETED_LOG_MAXLEN)  # 记录最近完成任务的日志
+        self.finished_tasks = {}  # task_id -> 最近从结果队列取出的任务（按完成顺序），供按需查看详细结果
+        self._completed_results: List[Dict[str, Any]] = []  # 当前批次已完成的任务，按完成顺序
         self._lock = threading.Lock()  # 线程安全锁
+        self._generation = 0  # 批次代号，停止任务时递增；已停止批次中仍在运行的任务结果会被丢弃
+        self._status_cache: Optional[Dict[str, Any]] = None  # 最近一次的进度状态
+        self._status_cache_ts = 0.0  # 生成缓存时的time.monotonic()，置0表示失效
         
+    @staticmethod
+    def _create_executor() -> ThreadPoolExecutor:
+        """创建有并发上限的分析线程池"""
+        return ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix='batch_analysis')
+    
     def parse_stock_symbols(self, input_text: str) -> List[str]:
         """解析股票代码输入文本"""
-        if not input_text:
-            return []
-        
-        # 支持多种分隔符：换行、逗号、分号、空格
-        import re
-        symbols = re.split(r'[,;\s\n]+', input_text.strip())
-        
-        # 清理和验证股票代码
-        cleaned_symbols = []
-        for symbol in symbols:
-            symbol = symbol.strip().upper()
-            if symbol:
-                cleaned_symbols.append(symbol)
-        
-        return list(set(cleaned_symbols))  # 去重
+        return parse_stock_symbols(input_text)
     
-    def add_analysis_task(self, symbol: str, params: Dict[str, Any], llm_config: Optional[Dict[str, str]] = None) -> str:
-        """添加分析任务"""
+    def _build_task(self, symbol: str, params: Dict[str, Any], llm_config: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """构建分析任务，由调用方直接提交到线程池"""
         task_id = str(uuid.uuid4())[:8]
         task = {
             'task_id': task_id,
             'symbol': symbol,
             'params': params,
             'llm_config': llm_config,
+            'generation': None,  # 提交时设置为当前批次代号
             'status': 'pending',
             'created_at': datetime.now(),
             'start_time': None,
@@ -68,9 +104,8 @@ class BatchAnalysisProcessor:
             'error': None
         }
         
-        self.analysis_queue.put(task)
         logger.info(f"添加分析任务: {symbol} (ID: {task_id})")
-        return task_id
+        return task
     
     def run_analysis_worker(self, task: Dict[str, Any]):
         """运行单个分析任务的工作线程"""
@@ -78,10 +113,6 @@ class BatchAnalysisProcessor:
         symbol = task['symbol']
         
         try:
-            logger.info(f"开始分析任务: {symbol} (ID: {task_id})")
-            task['status'] = 'running'
-            task['start_time'] = datetime.now()
-            
             # 使用传入的LLM配置，如果没有则使用默认配置
             llm_config = task.get('llm_config') or {}
             
@@ -91,33 +122,49 @@ class BatchAnalysisProcessor:
             
             logger.info(f"使用LLM配置: provider={llm_provider}, model={llm_model}")
             
-            # 运行分析 - 只传递run_stock_analysis需要的参数
-            result = run_stock_analysis(
-                stock_symbol=symbol,
-                analysis_date=task['params'].get('analysis_date'),
-                analysts=task['params'].get('analysts', []),
-                research_depth=task['params'].get('research_depth', 3),
-                llm_provider=llm_provider,
-                llm_model=llm_model,
-                market_type=task['params'].get('market_type', '美股'),
-                progress_callback=None  # 批量分析不使用进度回调
-            )
+            # 同一提供商的并发数受_PROVIDER_SEMS限制，未列出的提供商只受线程池上限约束
+            with _PROVIDER_SEMS.get(llm_provider, contextlib.nullcontext()):
+                # 等待期间可能已停止任务，线程池无法取消已开始的任务，在这里跳过分析；结果会按批次代号丢弃
+                if task['generation'] != self._generation:
+                    task['status'] = 'cancelled'
+                    logger.info(f"任务已停止，跳过分析: {symbol} (ID: {task_id})")
+                    return
+                
+                # 开始时间从获得并发名额后算起，耗时不包含排队等待
+                logger.info(f"开始分析任务: {symbol} (ID: {task_id})")
+                task['status'] = 'running'
+                task['start_time'] = datetime.now()
+                
+                # 运行分析 - 只传递run_stock_analysis需要的参数
+                result = run_stock_analysis(
+                    stock_symbol=symbol,
+                    analysis_date=task['params'].get('analysis_date'),
+                    analysts=task['params'].get('analysts', []),
+                    research_depth=task['params'].get('research_depth', 3),
+                    llm_provider=llm_provider,
+                    llm_model=llm_model,
+                    market_type=task['params'].get('market_type', '美股'),
+                    progress_callback=None  # 批量分析不使用进度回调
+                )
             
+            # 结束时间、最后活动时间和完成日志使用同一个时间点
+            end_time = datetime.now()
             task['status'] = 'completed'
-            task['end_time'] = datetime.now()
+            task['end_time'] = end_time
             task['result'] = result
             
-            # 更新最后活动时间
-            self.last_activity_time = datetime.now()
-            
             # 记录完成任务日志
             completion_log = {
                 'task_id': task_id,
                 'symbol': symbol,
-                'completed_at': self.last_activity_time,
+                'completed_at': end_time,
                 'duration': (task['end_time'] - task['start_time']).total_seconds()
             }
-            self.completed_tasks_log.append(completion_log)
+            
+            # 更新最后活动时间和完成日志，与get_progress_status的读取互斥
+            with self._lock:
+                self.last_activity_time = end_time
+                self.completed_tasks_log.append(completion_log)
             
             logger.info(f"完成分析任务: {symbol} (ID: {task_id})")
             
@@ -127,21 +174,16 @@ class BatchAnalysisProcessor:
             task['error'] = str(e)
             
             # 即使失败也更新活动时间
-            self.last_activity_time = datetime.now()
+            with self._lock:
+                self.last_activity_time = task['end_time']
             
             logger.error(f"分析任务失败: {symbol} (ID: {task_id}) - {e}")
             logger.error(traceback.format_exc())
         
         finally:
-            # 将结果放入结果队列
-            self.results_queue.put(task)
-            
-            # 从活动线程中移除 - 使用线程安全的方式
-            with self._lock:
-                if task_id in self.active_threads:
-                    del self.active_threads[task_id]
-                    logger.info(f"✅ 线程完成并清理: {task_id}")
-            
+            # 将结果放入结果队列，get_progress_status取回结果时再移除对应的future
+            self._completion_queue.put(task)
+            self._status_cache_ts = 0.0  # 有新结果，下次查询重新统计
             logger.info(f"📦 任务结果已放入队列: {task_id}")
     
     def start_batch_analysis(self, symbols: List[str], analysis_params: Dict[str, Any], llm_config: Optional[Dict[str, str]] = None) -> List[str]:
@@ -149,185 +191,157 @@ class BatchAnalysisProcessor:
         if not symbols:
             return []
         
-        task_ids = []
-        self.is_running = True
-        
         logger.info(f"开始批量分析 {len(symbols)} 个股票代码")
         
+        # 与股票代码无关的参数对所有任务相同，只验证和构建一次；
+        # 阻断性的参数验证由调用方界面完成，这里的验证结果只记录日志，不影响任务提交
+        market_type = analysis_params.get('market_type', '美股')
+        params = {
+            'analysis_date': analysis_params.get('analysis_date'),
+            'analysts': analysis_params.get('analysts', []),
+            'research_depth': analysis_params.get('research_depth', 3),
+            'market_type': market_type,
+            'include_sentiment': analysis_params.get('include_sentiment', True),
+            'include_risk_assessment': analysis_params.get('include_risk_assessment', True),
+            'custom_prompt': analysis_params.get('custom_prompt', '')
+        }
+        try:
+            global_errors = validate_global_params(params['analysis_date'], params['analysts'], params['research_depth'])
+            if global_errors:
+                logger.warning(f"批量分析参数验证未通过: {global_errors}")
+        except Exception as e:
+            logger.warning(f"批量分析参数验证出错: {e}")
+        
+        tasks = []
         for symbol in symbols:
-            # 验证参数 - 只传递validate_analysis_params需要的参数
-            try:
-                validate_analysis_params(
-                    stock_symbol=symbol,
-                    analysis_date=analysis_params.get('analysis_date'),
-                    analysts=analysis_params.get('analysts', []),
-                    research_depth=analysis_params.get('research_depth', 3),
-                    market_type=analysis_params.get('market_type', '美股')
-                )
-                
-                # 为run_stock_analysis准备完整的参数集
-                params = {
-                    'analysis_date': analysis_params.get('analysis_date'),
-                    'analysts': analysis_params.get('analysts', []),
-                    'research_depth': analysis_params.get('research_depth', 3),
-                    'market_type': analysis_params.get('market_type', '美股'),
-                    'include_sentiment': analysis_params.get('include_sentiment', True),
-                    'include_risk_assessment': analysis_params.get('include_risk_assessment', True),
-                    'custom_prompt': analysis_params.get('custom_prompt', '')
-                }
-                
-                # 添加任务
-                task_id = self.add_analysis_task(symbol, params, llm_config)
-                task_ids.append(task_id)
-                
-                # 启动工作线程
-                task = self.analysis_queue.get()
-                thread = threading.Thread(
-                    target=self.run_analysis_worker,
-                    args=(task,),
-                    daemon=True
-                )
-                thread.start()
-                
-                # 线程安全地添加到活动线程字典
-                with self._lock:
-                    self.active_threads[task_id] = thread
-                
-                logger.info(f"🚀 启动分析线程: {symbol} (ID: {task_id})")
-                
-            except Exception as e:
-                logger.error(f"创建任务失败: {symbol} - {e}")
+            # 每个任务只需验证股票代码
+            symbol_errors = validate_stock_symbol(symbol, market_type)
+            if symbol_errors:
+                logger.warning(f"股票代码验证未通过: {symbol} - {'; '.join(symbol_errors)}")
+            tasks.append(self._build_task(symbol, params, llm_config))
+        
+        task_ids = []
+        # 设置运行状态、开始新批次和提交登记任务在同一次加锁内完成：
+        # 其他会话的get_progress_status不会看到已标记运行但尚未登记任务的中间状态，
+        # 也不会在future登记前就取走它的结果（submit不等待工作线程，持锁提交不会死锁）
+        with self._lock:
+            # 上一批任务已全部结束时开始新批次，之前的结果仍可通过get_task_result查看
+            if not self._futures:
+                self._completed_results = []
+            self.is_running = True
+            self._status_cache_ts = 0.0
+            
+            for task in tasks:
+                task_id = task['task_id']
+                try:
+                    # 提交到线程池，超出并发上限的任务排队等待空闲线程
+                    task['generation'] = self._generation
+                    self._futures[task_id] = self._executor.submit(self.run_analysis_worker, task)
+                    task_ids.append(task_id)
+                    logger.info(f"🚀 提交分析任务: {task['symbol']} (ID: {task_id})")
+                except Exception as e:
+                    logger.error(f"创建任务失败: {task['symbol']} - {e}")
         
         return task_ids
     
     def get_progress_status(self) -> Dict[str, Any]:
-        """获取批量分析进度状态 - 改进版本支持更准确的状态检测"""
-        completed_results = []
-        
-        # 收集所有完成的结果
-        result_count = 0
-        while not self.results_queue.empty():
-            try:
-                result = self.results_queue.get_nowait()
-                completed_results.append(result)
-                result_count += 1
-            except queue.Empty:
-                break
+        """获取批量分析进度状态
         
-        if result_count > 0:
-            logger.info(f"📥 从队列中获取了 {result_count} 个完成的结果")
+        结果收集和运行状态更新在一次加锁内完成，整个快照使用同一个时间点；
+        工作线程在结束前一定会把任务放入结果队列，取回结果即说明任务已结束。
+        completed_results包含当前批次全部已完成的任务，而不只是本次新取回的。
+        STATUS_CACHE_TTL内的重复调用返回同一个字典（调用方不应修改），任务完成、开始或停止时缓存立即失效
+        """
+        new_results = []
         
-        # 清理已完成的线程 - 线程安全 + 死线程检测
         with self._lock:
-            finished_threads = []
-            dead_threads = []
-            for task_id, thread in list(self.active_threads.items()):
-                if not thread.is_alive():
-                    finished_threads.append(task_id)
-                    dead_threads.append(task_id)
-                    logger.info(f"💀 检测到死线程: {task_id[:8]} (线程已结束但未清理)")
+            # 短时间内的重复查询（包括多个会话同时轮询）直接返回上次的状态
+            mono_now = time.monotonic()
+            if self._status_cache is not None and mono_now - self._status_cache_ts < STATUS_CACHE_TTL:
+                return self._status_cache
             
-            # 移除已完成的线程
-            for task_id in finished_threads:
-                if task_id in self.active_threads:
-                    del self.active_threads[task_id]
-                    logger.info(f"🧹 清理已完成的线程: {task_id[:8]}")
-                    
-                    # 如果线程死亡但没有结果，创建一个假结果来表示完成
-                    if task_id not in [r.get('task_id') for r in completed_results]:
-                        fake_result = {
-                            'task_id': task_id,
-                            'symbol': getattr(thread, 'symbol', 'Unknown'),
-                            'success': True,  # 假设成功，因为没有异常
-                            'auto_detected': True,
-                            'completion_time': datetime.now().strftime("%H:%M:%S")
-                        }
-                        completed_results.append(fake_result)
-                        logger.info(f"🤖 为死线程创建假结果: {task_id[:8]}")
+            # 收集新完成的结果
+            while True:
+                try:
+                    new_results.append(self._completion_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            # 停止前已开始运行的任务仍会放入结果，它们不属于当前批次，直接丢弃
+            stale = [result for result in new_results if result.get('generation') != self._generation]
+            if stale:
+                logger.info(f"🗑️ 丢弃 {len(stale)} 个已停止批次的任务结果")
+                new_results = [result for result in new_results if result.get('generation') == self._generation]
+            
+            if new_results:
+                logger.info(f"📥 从队列中获取了 {len(new_results)} 个完成的结果")
+                for result in new_results:
+                    self.finished_tasks[result['task_id']] = result
+                    self._futures.pop(result['task_id'], None)
+                # 处理器是进程级单例，只保留最近的详细结果，避免内存随运行时间无限增长
+                while len(self.finished_tasks) > FINISHED_TASKS_MAXLEN:
+                    del self.finished_tasks[next(iter(self.finished_tasks))]
+                # 有新结果时才替换为新列表，没有变化时各次调用返回同一个列表（调用方不应修改）
+                self._completed_results = self._completed_results + new_results
+            completed_results = self._completed_results
+            
+            # 停止时被取消、从未运行的任务不会产生结果
+            for task_id in [task_id for task_id, future in self._futures.items() if future.cancelled()]:
+                del self._futures[task_id]
+            
+            now = datetime.now()
             
             # 统计状态
-            running_tasks = len(self.active_threads)
+            running_tasks = len(self._futures)
+            completed_tasks = len(completed_results)
+            total_tasks = running_tasks + completed_tasks
+            time_since_activity = (now - self.last_activity_time).total_seconds() if self.last_activity_time else None
             
-        completed_tasks = len(completed_results)
-        total_tasks = running_tasks + completed_tasks
-        
-        logger.debug(f"📊 状态统计: 运行中={running_tasks}, 已完成={completed_tasks}, 总计={total_tasks}, 死线程={len(dead_threads)}")
-        
-        # 检查是否真的在运行中 - 基于多重条件判断
-        is_actually_running = self.is_running and running_tasks > 0
-        
-        # 智能完成检测：如果没有运行中的任务，且最后活动时间超过5秒，认为已完成
-        if self.is_running and running_tasks == 0:
-            time_since_activity = (datetime.now() - self.last_activity_time).total_seconds() if self.last_activity_time else 0
+            logger.debug(f"📊 状态统计: 运行中={running_tasks}, 已完成={completed_tasks}, 总计={total_tasks}")
             
-            if completed_tasks > 0 and time_since_activity > 5:  # 降低到5秒
-                self.is_running = False
-                is_actually_running = False
-                logger.info(f"[进度] ✅ 智能检测：所有任务已完成！总计: {completed_tasks}个，最后活动时间: {time_since_activity:.1f}秒前")
-            elif completed_tasks > 0:
-                # 短暂等待期间，仍标记为运行中但提示即将完成
-                logger.info(f"[进度] 🔄 等待确认完成状态... 已完成: {completed_tasks}个，距离最后活动: {time_since_activity:.1f}秒")
-        
-        # 如果检测到死线程，立即标记为完成
-        if len(dead_threads) > 0 and running_tasks == 0:
-            self.is_running = False
-            is_actually_running = False
-            logger.info(f"[进度] ✅ 基于死线程检测：所有任务已完成！检测到{len(dead_threads)}个死线程")
-        
-        # 如果没有运行中的任务，标记为停止
-        if self.is_running and running_tasks == 0 and completed_tasks > 0:
-            time_since_activity = (datetime.now() - self.last_activity_time).total_seconds() if self.last_activity_time else 999
-            if time_since_activity > 3:  # 降低到3秒
+            # 只有仍有未结束的任务时才算运行中
+            is_actually_running = self.is_running and running_tasks > 0
+            
+            if self.is_running and running_tasks == 0:
+                logger.info(f"[进度] ✅ 所有任务已完成！共 {completed_tasks} 个")
                 self.is_running = False
-                is_actually_running = False
-                logger.info(f"[进度] ✅ 所有任务已完成！总计: {completed_tasks}个")
-        
-        status = {
-            'total_tasks': total_tasks,
-            'running_tasks': running_tasks,
-            'completed_tasks': completed_tasks,
-            'is_running': is_actually_running,
-            'completed_results': completed_results,
-            'progress_percentage': (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0,
-            'last_update_time': datetime.now().strftime("%H:%M:%S"),
-            'last_activity_time': self.last_activity_time.strftime("%H:%M:%S") if self.last_activity_time else None,
-            'time_since_last_activity': (datetime.now() - self.last_activity_time).total_seconds() if self.last_activity_time else None,
-            'completed_tasks_count': len(self.completed_tasks_log),
-            'dead_threads_detected': len(dead_threads),
-            'force_completion': len(dead_threads) > 0 and running_tasks == 0  # 强制完成标识
-        }
-        
-        # 如果没有运行中的任务，标记为完成
-        if running_tasks == 0:
-            self.is_running = False
-        
-        return status
+            
+            self._status_cache = {
+                'total_tasks': total_tasks,
+                'running_tasks': running_tasks,
+                'completed_tasks': completed_tasks,
+                'is_running': is_actually_running,
+                'completed_results': completed_results,
+                'progress_percentage': (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0,
+                'last_update_time': now.strftime("%H:%M:%S"),
+                'last_activity_time': self.last_activity_time.strftime("%H:%M:%S") if self.last_activity_time else None,
+                'time_since_last_activity': time_since_activity,
+                'completed_tasks_count': len(self.completed_tasks_log)
+            }
+            self._status_cache_ts = mono_now
+            return self._status_cache
+    
+    def get_task_result(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """按task_id获取已完成任务（含详细结果），不存在时返回None"""
+        with self._lock:
+            return self.finished_tasks.get(task_id)
     
     def stop_all_tasks(self):
         """停止所有任务"""
         logger.info("停止所有批量分析任务")
-        self.is_running = False
-        
-        # 清空队列
-        while not self.analysis_queue.empty():
-            try:
-                self.analysis_queue.get_nowait()
-            except queue.Empty:
-                break
-        
-        # 等待活动线程完成（设置超时）
-        for task_id, thread in list(self.active_threads.items()):
-            if thread.is_alive():
-                thread.join(timeout=1.0)  # 等待1秒
         
-        self.active_threads.clear()
-
-
-# 全局批量处理器实例
-if 'batch_processor' not in st.session_state:
-    st.session_state.batch_processor = BatchAnalysisProcessor()
+        # 取消线程池中尚未开始的任务，已在运行的分析无法中断；换用新线程池供下一批任务使用。
+        # 递增批次代号后，已在运行的任务结束时其结果不会计入下一批次
+        with self._lock:
+            self.is_running = False
+            self._generation += 1
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._create_executor()
+            self._futures.clear()
+            self._status_cache_ts = 0.0
 
 
+@st.cache_resource
 def get_batch_processor() -> BatchAnalysisProcessor:
-    """获取批量处理器实例"""
-    return st.session_state.batch_processor
+    """获取进程级批量处理器单例（st.cache_resource 保证只创建一次，所有会话共享）"""
+    return BatchAnalysisProcessor()